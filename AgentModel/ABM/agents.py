@@ -1,5 +1,7 @@
 from mesa import Agent
 from ABM.walk import Walker
+from ABM.log import REST, MOVE, PLANT, EAT, DIED
+from ABM.plants import Column
 import random
 
 class Human(Walker):
@@ -20,18 +22,19 @@ class Human(Walker):
             self.model.oxygen -= 0.0416*0.06265*2.1
             self.model.carbon += 0.0416*0.05776*2
         '''
-        action = ''
+        action = REST
 
         self.model.temp += (((310-self.model.temp)*0.04372)/(1.29*1000*0.001005))
         cell = self.current_cell(self.pos,Plant)
 
         if self.model.oxygen < 15.17 or self.model.carbon > 0.53 or self.energy < 0:
-            action += 'Died\n'
+            action = DIED
             self.model.grid._remove_agent(self.pos, self)
             self.model.schedule.remove(self)
 
         elif self.model.schedule.get_agent_count(Plant)>0 and (self.energy < 75) and not(isinstance(cell,Plant)):
             self.move_toward_plant(Plant)
+            action = MOVE
             self.energy -= 11.82*(1/24)
             self.model.oxygen -= 0.0416*0.06265*2.1
             self.model.carbon += 0.0416*0.05776*2
@@ -43,11 +46,13 @@ class Human(Walker):
                 self.model.grid.place_agent(plant, self.pos)
                 self.model.schedule.add(plant)
                 self.move_from_plant(self)
+                action = PLANT
                 self.model.oxygen -= 0.0416*0.06265*2.1
                 self.model.carbon += 0.0416*0.05776*2
                 self.energy -= 11.82*(1/24)
             else:
                 self.move_from_plant(Plant)
+                action = MOVE
 
         elif (self.model.carbon < 0.04 or self.energy < 75) and isinstance(cell, Plant):
             if (cell.grown):
@@ -55,6 +60,7 @@ class Human(Walker):
                 self.model.grid._remove_agent(cell.pos, cell)
                 self.model.schedule.remove(cell)
                 self.move_toward_plant(Plant)
+                action = EAT
                 self.energy -= 7.43*(1/24)
                 self.model.oxygen -= 0.0416*0.06265*0.63
                 self.model.carbon += 0.0416*0.05776*0.63
@@ -67,42 +73,27 @@ class Human(Walker):
             self.model.oxygen -= 0.0416*0.06265*0.63
             self.model.carbon += 0.0416*0.05776*0.63
 
-        with open(self.model.fileName, 'a+') as f:
-            f.write("\nHuman {}\n{}".format(self.idNum,action))
+        self.model.log.action(self.idNum, action)
 
 
 class Plant(Agent):
+    '''
+    Agent-like view of one plant in the model's PlantEngine. Scheduled plants
+    are stepped in bulk by the engine; Plant.step only steps this one.
+    '''
+
+    pos = Column('pos')
+    turnCount = Column('turnCount')
+    grown = Column('grown')
+    mature = Column('mature')
+    co2 = Column('co2')
+    oxy = Column('oxy')
 
     def __init__(self, pos,oxy,co2, model, turnCount=20, mature=10,grown=False):
         super().__init__(pos, model)
-        self.pos = pos
-        self.turnCount = turnCount
-        self.grown = grown
-        self.mature = mature
-        self.co2 = co2
-        self.oxy = oxy
+        self.engine = model.plants
+        self.slot = None
+        self.detached = dict(pos=pos, turnCount=turnCount, grown=grown, mature=mature, co2=co2, oxy=oxy)
 
     def step(self):
-        if (self.mature>0):
-            self.mature-=1
-        else:
-            self.grown = True
-
-        self.model.oxygen += 0.0416*(self.oxy/32)*(3.369/1000)
-        self.model.carbon -= 0.0416*(self.co2/44)*(3.369/1000)
-
-        if (self.model.carbon<0):
-            self.model.carbon = 0
-
-        if self.turnCount <= 0 and self.model.regrowth:
-            neighbors = self.model.grid.get_neighborhood(self.pos,moore=False)
-            coords = self.model.schedule.empty_neighbor_finder(neighbors, Plant)
-            plant = Plant(coords,oxy,co2,self.model,self.model.spread)
-            self.model.grid.place_agent(plant, coords)
-            self.model.schedule.add(plant)
-            self.turnCount = self.model.spread
-
-
-        if self.model.carbon < 0.015:
-            self.model.grid._remove_agent(self.pos, self)
-            self.model.schedule.remove(self)
+        self.engine.step([self.slot])
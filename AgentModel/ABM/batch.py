@@ -0,0 +1,181 @@
+import itertools
+import multiprocessing
+import random
+
+import numpy as np
+
+from ABM.log import OFF
+from ABM.model import SingleRoomModel, SERIES
+
+# Model parameters used when a run does not set them
+DEFAULTS = dict(scrubber=False, regrowth=False, excess_co2=False, excess_amount=1,
+                solar=0, h_agents=1, p_agents=5, plants_spread=20)
+
+
+def parameter_grid(**values):
+    '''
+    Expand lists of parameter values into every combination.
+
+    >>> parameter_grid(h_agents=[1, 2], scrubber=True)
+    [{'h_agents': 1, 'scrubber': True}, {'h_agents': 2, 'scrubber': True}]
+    '''
+    names = list(values)
+    choices = [v if isinstance(v, (list, tuple, range, np.ndarray)) else [v] for v in values.values()]
+    return [dict(zip(names, combo)) for combo in itertools.product(*choices)]
+
+
+def run_one(params, steps, seed=None):
+    ''' Run a single headless model and return its series. '''
+    model = SingleRoomModel(log_level=OFF, seed=seed, **dict(DEFAULTS, **params))
+    return model.run_model(steps)
+
+
+def _run_task(task):
+    return run_one(*task)
+
+
+class BatchResult:
+    '''
+    Output of run_batch.
+
+    params[i] and replicate[i] describe run i, and series[name][i] holds its
+    time series for each name in SERIES as a (runs, steps) array.
+    '''
+
+    def __init__(self, params, replicate, series):
+        self.params = params
+        self.replicate = replicate
+        self.series = series
+
+    def __len__(self):
+        return len(self.params)
+
+    def __getitem__(self, name):
+        return self.series[name]
+
+    def to_dataframe(self):
+        ''' Long format DataFrame with one row per run and step. '''
+        import pandas as pd
+
+        runs, steps = self.series[SERIES[0]].shape
+        columns = {'run': np.repeat(np.arange(runs), steps),
+                   'replicate': np.repeat(self.replicate, steps),
+                   'step': np.tile(np.arange(1, steps + 1), runs)}
+        for name in sorted(set().union(*self.params)):
+            columns[name] = np.repeat([p.get(name) for p in self.params], steps)
+        for name in SERIES:
+            columns[name] = self.series[name].ravel()
+        return pd.DataFrame(columns)
+
+
+def run_batch(params, replicates=1, steps=200, processes=None, seed=None, cache=None):
+    '''
+    Run SingleRoomModel headlessly for every parameter set and replicate.
+
+    Args:
+        params: A list of parameter dicts, or a dict of value lists which is
+                expanded with parameter_grid. Missing parameters use DEFAULTS.
+        replicates: Number of runs of each parameter set.
+        steps: Number of steps in each run.
+        processes: Size of the process pool (default: all cores). With 1 the
+                   runs happen in this process.
+        seed: Seed for the first run; run i uses seed + i. Runs are seeded
+              from fresh entropy when not given.
+        cache: Optional RunCache. Runs found in it are not simulated again
+               and new runs are added to it.
+
+    Returns:
+        A BatchResult.
+    '''
+    if isinstance(params, dict):
+        params = parameter_grid(**params)
+    runs = [(dict(DEFAULTS, **p), r) for p in params for r in range(replicates)]
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    tasks = [(p, steps, (seed + i) % 2**32) for i, (p, _) in enumerate(runs)]
+
+    results = [None]*len(tasks)
+    keys = [None]*len(tasks)
+    if cache is not None:
+        for i, task in enumerate(tasks):
+            keys[i] = cache.key(*task)
+            results[i] = cache.get(keys[i])
+    missing = [i for i, result in enumerate(results) if result is None]
+    pending = [tasks[i] for i in missing]
+
+    if processes == 1 or len(pending) <= 1:
+        computed = list(map(_run_task, pending))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            chunksize = max(1, len(pending) // (4*(processes or multiprocessing.cpu_count())))
+            computed = pool.map(_run_task, pending, chunksize)
+
+    for i, result in zip(missing, computed):
+        results[i] = result
+        if cache is not None:
+            cache.put(keys[i], result)
+
+    series = {name: np.zeros((len(tasks), steps)) for name in SERIES}
+    for i, result in enumerate(results):
+        for name in SERIES:
+            series[name][i] = result[name]
+    return BatchResult([p for p, _ in runs], np.array([r for _, r in runs], dtype=int), series)
+
+
+_checkpoint = None  # Checkpoint shared by the workers of run_forks
+
+
+def _init_fork_worker(checkpoint):
+    global _checkpoint
+    _checkpoint = checkpoint
+
+
+def _run_fork(task):
+    changes, steps, seed = task
+    return _checkpoint.fork(seed=seed, **changes).run_model(steps)
+
+
+def run_forks(checkpoint, variants, replicates=1, steps=200, processes=None, seed=None):
+    '''
+    Continue a checkpointed model once for every variant and replicate.
+
+    The shared prefix is simulated once, before the checkpoint was taken;
+    every run starts from a fork of it (see Checkpoint.fork).
+
+    Args:
+        checkpoint: An ABM.checkpoint.Checkpoint.
+        variants: A list of dicts of model attributes to change, e.g.
+                  [{'scrubber': True}, {'scrubber': True, 'solar': 400}], or
+                  a dict of value lists expanded with parameter_grid.
+        replicates: Number of runs of each variant.
+        steps: Number of steps each run continues for.
+        processes: Size of the process pool (default: all cores). With 1 the
+                   runs happen in this process.
+        seed: Seed for the first run; run i uses seed + i. Without a seed a
+              single replicate keeps the checkpoint's random number streams,
+              so variants differ only by their changes, and several
+              replicates are seeded from fresh entropy.
+
+    Returns:
+        A BatchResult whose series start at the step after the checkpoint.
+    '''
+    if isinstance(variants, dict):
+        variants = parameter_grid(**variants)
+    runs = [(v, r) for v in variants for r in range(replicates)]
+    if seed is None and replicates > 1:
+        seed = random.SystemRandom().randrange(2**32)
+    tasks = [(v, steps, None if seed is None else (seed + i) % 2**32) for i, (v, _) in enumerate(runs)]
+
+    if processes == 1 or len(tasks) <= 1:
+        _init_fork_worker(checkpoint)
+        results = list(map(_run_fork, tasks))
+    else:
+        with multiprocessing.Pool(processes, _init_fork_worker, (checkpoint,)) as pool:
+            chunksize = max(1, len(tasks) // (4*(processes or multiprocessing.cpu_count())))
+            results = pool.map(_run_fork, tasks, chunksize)
+
+    series = {name: np.zeros((len(tasks), steps)) for name in SERIES}
+    for i, result in enumerate(results):
+        for name in SERIES:
+            series[name][i] = result[name]
+    return BatchResult([v for v, _ in runs], np.array([r for _, r in runs], dtype=int), series)
@@ -0,0 +1,122 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from ABM.crops import DATA_FILE
+
+ABM_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Eviction deletes runs until the directory is this fraction of max_bytes, so
+# a full cache is not listed again on every put
+EVICT_TO = 0.9
+
+_code_version = None
+_data_hash = (None, None)
+
+
+def code_version():
+    ''' Hash of the model sources, so cached runs expire when the model changes. '''
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(ABM_DIR, '*.py'))):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def data_hash():
+    global _data_hash
+    mtime = os.stat(DATA_FILE).st_mtime
+    if _data_hash[0] != mtime:
+        with open(DATA_FILE, 'rb') as f:
+            _data_hash = (mtime, hashlib.sha256(f.read()).hexdigest())
+    return _data_hash[1]
+
+
+class RunCache:
+    '''
+    Content-addressed store of model run series on disk.
+
+    Runs are keyed by their parameters, seed, step count, crop data and model
+    source, and saved as one .npz file each. Reading a run marks it as recently
+    used; once the directory holds more than max_bytes the least recently used
+    runs are deleted, down to EVICT_TO of max_bytes.
+
+    The size of the directory is kept as a running total (bytes), counted once
+    here and then updated by put, so the directory is only listed again when
+    the total goes over max_bytes. Other processes writing to the same
+    directory are accounted for at that point.
+    '''
+
+    def __init__(self, directory='cache', max_bytes=256*2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.bytes = sum(size for _, size, _ in self._entries())
+
+    def key(self, params, seed, steps):
+        content = {'params': params, 'seed': seed, 'steps': steps,
+                   'data': data_hash(), 'code': code_version()}
+        text = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                series = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return series
+
+    def put(self, key, series):
+        path = self.path(key)
+        tmp = path + '.{}.tmp'.format(os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, **series)
+            size = f.tell()
+        try:
+            self.bytes -= os.stat(path).st_size  # Replacing an existing run
+        except OSError:
+            pass
+        os.replace(tmp, path)
+        self.bytes += size
+        if self.bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= EVICT_TO*self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.bytes = total
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            os.remove(path)
+        self.bytes = 0
@@ -0,0 +1,102 @@
+import pickle
+import random
+import struct
+import zlib
+
+import numpy as np
+
+from ABM.cache import code_version
+from ABM.log import StepLog, OFF
+
+MAGIC = b'ABMC'
+VERSION = 1
+# magic, format version, flags (bit 0: zlib compressed), model step, code version
+HEADER = struct.Struct('<4sBBI64s')
+COMPRESSED = 1
+
+
+class Checkpoint:
+    '''
+    Snapshot of the complete state of a model.
+
+    The snapshot covers everything the next step depends on: gas levels and
+    temperature, both random number generators, the agents with their grid
+    positions, the plant columns, the scheduler's agent order and the
+    collected history. It is one pickle, taken once; every restore() or
+    fork() unpickles a fresh, independent copy, which is much cheaper than
+    simulating the prefix again.
+
+        model.run_model(500)
+        checkpoint = Checkpoint(model)
+        variants = [checkpoint.fork(scrubber=True, seed=i) for i in range(1000)]
+
+    Checkpoints written by save() are tied to the model code (see
+    cache.code_version) and refuse to load after it changed, unless
+    check=False.
+
+    A model cannot be checkpointed while a Profiler is installed on it.
+    '''
+
+    def __init__(self, model):
+        self.data = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+        self.step = model.stepNum
+
+    def __len__(self):
+        return len(self.data)
+
+    def restore(self):
+        ''' A copy of the model as it was, logging on to the same log file. '''
+        return pickle.loads(self.data)
+
+    def fork(self, seed=None, log_level=OFF, log_path=None, **changes):
+        '''
+        A copy of the model with attributes replaced by changes, e.g.
+        fork(scrubber=True).
+
+        Forks draw the same random numbers as the original unless given a
+        seed. They do not log unless a log_level and log_path are given, as
+        forks of one model would otherwise write to one file.
+        '''
+        model = self.restore()
+        for name, value in changes.items():
+            if not hasattr(model, name):
+                raise AttributeError('{} has no attribute {!r}'.format(type(model).__name__, name))
+            setattr(model, name, value)
+        if seed is not None:
+            reseed(model, seed)
+        if log_level != OFF and log_path is None:
+            raise ValueError('a forked model which logs needs its own log_path')
+        model.log = StepLog(log_path or model.fileName, log_level)
+        return model
+
+    def save(self, path, compress=True):
+        flags = COMPRESSED if compress else 0
+        data = zlib.compress(self.data, 1) if compress else self.data
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, flags, self.step, code_version().encode()))
+            f.write(data)
+
+    @classmethod
+    def load(cls, path, check=True):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            data = f.read()
+        magic, version, flags, step, code = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a model checkpoint'.format(path))
+        if check and code.decode() != code_version():
+            raise ValueError('{} was written by a different version of the model code'.format(path))
+        if flags & COMPRESSED:
+            data = zlib.decompress(data)
+        checkpoint = cls.__new__(cls)
+        checkpoint.data = data
+        checkpoint.step = step
+        return checkpoint
+
+
+def reseed(model, seed):
+    ''' Give a model new random number generators, as if it had been built with seed. '''
+    model.seed = seed
+    model.random = random.Random(seed)
+    model.grid.random = model.random
+    model.np_random = np.random.RandomState(seed % 2**32)
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class SeriesCollector:
+    '''
+    Collects model variables into preallocated NumPy columns.
+
+    Every collect() writes one row of float64 values, one per reporter, into a
+    (capacity, columns) array which doubles in size when full, so appending is
+    amortized O(1) and never creates Python objects. column() and model_vars
+    return views into that array, without copying.
+
+    With ring=N only the last N rows are kept, in a buffer of 2*N rows where
+    every row is written twice (at i and i + N); the last N rows are then
+    always one contiguous slice, so the views stay zero-copy in this mode too.
+
+    The interface covers what ChartModule and the server use of mesa's
+    DataCollector: collect(model), model_vars[name] and
+    get_model_vars_dataframe().
+
+    Args:
+        model_reporters: Dict of column name -> function of the model.
+        capacity: Initial number of rows (growable mode).
+        ring: Number of rows to keep, or None to keep every row.
+    '''
+
+    def __init__(self, model_reporters, capacity=256, ring=None):
+        self.names = list(model_reporters)
+        self.reporters = [model_reporters[name] for name in self.names]
+        self.columns = {name: i for i, name in enumerate(self.names)}
+        self.ring = ring
+        self.rows = 0  # Rows collected so far, including any dropped from the ring
+        if ring:
+            self.data = np.zeros((2 * ring, len(self.names)))
+        else:
+            self.data = np.zeros((max(capacity, 1), len(self.names)))
+
+    def __len__(self):
+        ''' Number of rows currently held. '''
+        return min(self.rows, self.ring) if self.ring else self.rows
+
+    def collect(self, model):
+        row = [reporter(model) for reporter in self.reporters]
+        if self.ring:
+            i = self.rows % self.ring
+            self.data[i] = row
+            self.data[i + self.ring] = row
+        else:
+            if self.rows == len(self.data):
+                grown = np.zeros((2 * len(self.data), len(self.names)))
+                grown[:self.rows] = self.data
+                self.data = grown
+            self.data[self.rows] = row
+        self.rows += 1
+
+    def extend(self, columns):
+        '''
+        Append many rows at once, given as a dict of column name -> array (or
+        a constant), e.g. for steps which were extrapolated rather than run.
+        '''
+        count = max(np.size(value) for value in columns.values())
+        rows = np.empty((count, len(self.names)))
+        for name, value in columns.items():
+            rows[:, self.columns[name]] = value
+        if self.ring:
+            if count > self.ring:
+                self.rows += count - self.ring
+                rows = rows[-self.ring:]
+            i = (self.rows + np.arange(len(rows))) % self.ring
+            self.data[i] = rows
+            self.data[i + self.ring] = rows
+            self.rows += len(rows)
+            return
+        if self.rows + count > len(self.data):
+            grown = np.zeros((max(2 * len(self.data), self.rows + count), len(self.names)))
+            grown[:self.rows] = self.data[:self.rows]
+            self.data = grown
+        self.data[self.rows:self.rows + count] = rows
+        self.rows += count
+
+    @property
+    def first(self):
+        ''' Index (counted from the first collect) of the oldest row held. '''
+        return self.rows - len(self)
+
+    def table(self):
+        ''' View of the held rows as a (rows, columns) array, oldest first. '''
+        if self.ring and self.rows > self.ring:
+            start = self.rows % self.ring
+            return self.data[start:start + self.ring]
+        return self.data[:self.rows]
+
+    def column(self, name):
+        return self.table()[:, self.columns[name]]
+
+    def since(self, row):
+        '''
+        Rows collected since row (counted from the first collect), as a view.
+        Rows which have already left the ring are skipped.
+        '''
+        table = self.table()
+        return table[max(row - self.first, 0):]
+
+    @property
+    def model_vars(self):
+        return {name: self.column(name) for name in self.names}
+
+    def get_model_vars_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.table(), columns=self.names,
+                            index=np.arange(self.first, self.rows))
@@ -0,0 +1,45 @@
+import json
+import os
+
+import numpy as np
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'data.json')
+
+FIELDS = ('Oxygen', 'Carbon', 'Water', 'Edible', 'Inedible')
+CROP_DTYPE = np.dtype([('name', 'U32')] + [(field, '<f8') for field in FIELDS])
+
+# path -> (mtime, table, name -> row)
+_tables = {}
+
+
+def crop_table(path=DATA_FILE):
+    '''
+    Return the crops in data.json as a structured array with one row per crop.
+
+    The file is parsed once per process and only read again when its
+    modification time changes.
+    '''
+    mtime = os.stat(path).st_mtime
+    cached = _tables.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r') as f:
+            plants = json.load(f)['Plants']
+        table = np.zeros(len(plants), dtype=CROP_DTYPE)
+        for row, (name, values) in zip(table, plants.items()):
+            row['name'] = name
+            for field in FIELDS:
+                row[field] = values[field]
+        table.flags.writeable = False
+        cached = (mtime, table, {name: i for i, name in enumerate(plants)})
+        _tables[path] = cached
+    return cached[1]
+
+
+def crop_names(path=DATA_FILE):
+    return list(crop_table(path)['name'])
+
+
+def get_crop(name, path=DATA_FILE):
+    ''' Look up one crop's row by name. Raises KeyError for unknown crops. '''
+    table = crop_table(path)
+    return table[_tables[path][2][name]]
@@ -0,0 +1,57 @@
+import heapq
+
+
+class TimerWheel:
+    '''
+    Queue of events due at integer ticks.
+
+    Events due within ``size`` ticks of now sit in a ring of buckets, one per
+    tick; events further ahead wait in an overflow heap and move into the ring
+    as it turns. Scheduling and popping a tick are O(1) (amortized for the
+    overflow), independent of how many events are pending.
+    '''
+
+    def __init__(self, size=256, now=0):
+        self.size = size
+        self.now = now
+        self.buckets = [[] for _ in range(size)]
+        self.overflow = []
+        self.count = 0
+        self.seq = 0  # Tie breaker, so the heap never compares events
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, tick, event):
+        ''' Add event at tick; ticks in the past are due now. '''
+        if tick < self.now:
+            tick = self.now
+        if tick < self.now + self.size:
+            self.buckets[tick % self.size].append(event)
+        else:
+            heapq.heappush(self.overflow, (tick, self.seq, event))
+            self.seq += 1
+        self.count += 1
+
+    def pop(self):
+        ''' Remove and return the events due now, and advance now by one tick. '''
+        i = self.now % self.size
+        due = self.buckets[i]
+        self.buckets[i] = []
+        self.now += 1
+        horizon = self.now + self.size
+        while self.overflow and self.overflow[0][0] < horizon:
+            tick, _, event = heapq.heappop(self.overflow)
+            self.buckets[tick % self.size].append(event)
+        self.count -= len(due)
+        return due
+
+    def advance(self, ticks):
+        ''' Remove and return every event due in the next ticks ticks, and advance now past them. '''
+        due = []
+        end = self.now + ticks
+        while self.count and self.now < end:
+            due.extend(self.pop())
+        # With nothing pending the ring is empty, so now can jump ahead
+        self.now = max(self.now, end)
+        return due
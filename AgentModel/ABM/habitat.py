@@ -0,0 +1,166 @@
+import multiprocessing
+import random
+
+import numpy as np
+
+from ABM.batch import DEFAULTS
+from ABM.log import OFF
+from ABM.model import SingleRoomModel
+
+# Gases exchanged between rooms, as SingleRoomModel attributes
+GASES = ('carbon', 'oxygen')
+# Time series returned by HabitatModel.run_model, one row per room
+ROOM_SERIES = ('carbon', 'oxygen', 'humans', 'plants')
+
+
+def _build_rooms(rooms):
+    return [SingleRoomModel(log_level=OFF, seed=seed, **dict(DEFAULTS, **params))
+            for params, seed in rooms]
+
+
+def _step_rooms(models, gases):
+    ''' Set each room's gases, step it and return its state as a (rooms, ROOM_SERIES) array. '''
+    state = np.empty((len(models), len(ROOM_SERIES)))
+    for model, (carbon, oxygen), row in zip(models, gases, state):
+        model.carbon = carbon
+        model.oxygen = oxygen
+        model.step()
+        row[:] = (model.carbon, model.oxygen, model.h_agents, model.p_agents)
+    return state
+
+
+def _room_worker(conn, rooms):
+    ''' Main loop of a worker process owning some of the rooms. '''
+    models = _build_rooms(rooms)
+    while True:
+        try:
+            command, payload = conn.recv()
+        except EOFError:
+            return
+        if command == 'step':
+            conn.send(_step_rooms(models, payload))
+        elif command == 'get':
+            conn.send([getattr(model, payload) for model in models])
+        elif command == 'close':
+            return
+
+
+class HabitatModel:
+    '''
+    A habitat of several rooms connected by ventilation.
+
+    Every room is a SingleRoomModel with its own grid, agents and gases.
+    Each tick all rooms step independently, then gas is exchanged along the
+    ventilation matrix: ventilation[i][j] is the volume of air moved each way
+    between rooms i and j per step, so with room volumes v
+
+        c_i <- c_i + sum_j ventilation[i][j] * (c_j - c_i) / v_i
+
+    for the carbon dioxide and oxygen partial pressures c. The exchange
+    conserves the total amount of each gas.
+
+    With processes > 1 the rooms are spread over that many worker processes
+    which step their rooms in parallel; per tick the parent sends every
+    worker the exchanged gas levels of its rooms and receives their new
+    state, which is the only synchronisation between rooms.
+
+    Args:
+        rooms: A list with one dict of SingleRoomModel parameters per room
+               (missing ones use batch.DEFAULTS).
+        ventilation: (rooms, rooms) matrix of exchanged volumes; it is
+                     symmetrised and its diagonal ignored.
+        volumes: Volume of each room, in the units of ventilation (default 1).
+        processes: Number of worker processes, 1 steps the rooms in this
+                   process.
+        seed: Seed of room 0; room i uses seed + i.
+    '''
+
+    def __init__(self, rooms, ventilation, volumes=None, processes=1, seed=None):
+        n = len(rooms)
+        ventilation = np.array(ventilation, dtype=float)
+        if ventilation.shape != (n, n):
+            raise ValueError('ventilation must be a {0}x{0} matrix'.format(n))
+        ventilation = (ventilation + ventilation.T) / 2
+        np.fill_diagonal(ventilation, 0)
+        self.volumes = np.ones(n) if volumes is None else np.asarray(volumes, dtype=float)
+        if (ventilation < 0).any():
+            raise ValueError('ventilation volumes cannot be negative')
+        if (ventilation.sum(axis=1) > self.volumes).any():
+            raise ValueError('a room cannot exchange more than its volume per step')
+        self.ventilation = ventilation
+        # Exchange as one matrix product: c <- exchange @ c
+        self.exchange = np.eye(n) + (ventilation - np.diag(ventilation.sum(axis=1))) / self.volumes[:, None]
+
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**32)
+        self.seed = seed
+        self.params = [dict(DEFAULTS, **params) for params in rooms]
+        specs = [(params, (seed + i) % 2**32) for i, params in enumerate(self.params)]
+        self.gases = np.array([[params.get('carbon', 0.13), params.get('oxygen', 21.21)]
+                               for params in self.params])
+        self.state = np.zeros((n, len(ROOM_SERIES)))
+        self.stepNum = 0
+
+        processes = max(min(processes or multiprocessing.cpu_count(), n), 1)
+        self.models = None
+        self.workers = []
+        if processes == 1:
+            self.models = _build_rooms(specs)
+            self.gases[:] = [[model.carbon, model.oxygen] for model in self.models]
+        else:
+            # Contiguous blocks of rooms per worker
+            for block in np.array_split(np.arange(n), processes):
+                parent_conn, child_conn = multiprocessing.Pipe()
+                process = multiprocessing.Process(
+                    target=_room_worker, args=(child_conn, [specs[i] for i in block]), daemon=True)
+                process.start()
+                self.workers.append((block, parent_conn, process))
+
+    def __len__(self):
+        return len(self.params)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def step(self):
+        if self.models is not None:
+            self.state[:] = _step_rooms(self.models, self.gases)
+        else:
+            for block, conn, _ in self.workers:
+                conn.send(('step', self.gases[block]))
+            for block, conn, _ in self.workers:
+                self.state[block] = conn.recv()
+        self.gases[:] = np.maximum(self.exchange @ self.state[:, :len(GASES)], 0)
+        self.stepNum += 1
+
+    def run_model(self, step_count=200):
+        ''' Step every room; returns ROOM_SERIES as (rooms, steps) arrays, gases after the exchange. '''
+        series = {name: np.zeros((len(self), step_count)) for name in ROOM_SERIES}
+        for i in range(step_count):
+            self.step()
+            series['carbon'][:, i] = self.gases[:, 0]
+            series['oxygen'][:, i] = self.gases[:, 1]
+            series['humans'][:, i] = self.state[:, 2]
+            series['plants'][:, i] = self.state[:, 3]
+        return series
+
+    def room_attribute(self, name):
+        ''' Read an attribute of every room, e.g. room_attribute('p_agents'). '''
+        if self.models is not None:
+            return [getattr(model, name) for model in self.models]
+        values = [None] * len(self)
+        for block, conn, _ in self.workers:
+            conn.send(('get', name))
+            for i, value in zip(block, conn.recv()):
+                values[i] = value
+        return values
+
+    def close(self):
+        for _, conn, process in self.workers:
+            conn.send(('close', None))
+            conn.close()
+            process.join(timeout=1)
+        self.workers = []
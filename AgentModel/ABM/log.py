@@ -0,0 +1,154 @@
+import os
+import sys
+import weakref
+
+import numpy as np
+
+# Verbosity levels
+OFF = 0         # nothing is recorded
+STEPS = 1       # one record per model step
+ACTIONS = 2     # step records plus one record per human action
+
+# Human actions
+REST, MOVE, PLANT, EAT, DIED = range(5)
+# How each action appears in the text log: the original format only named deaths
+ACTION_NAMES = ('', '', '', '', 'Died')
+
+STEP_DTYPE = np.dtype([('step', '<i4'), ('carbon', '<f8'), ('oxygen', '<f8'),
+                       ('temp', '<f8'), ('humans', '<i4'), ('plants', '<i4')])
+ACTION_DTYPE = np.dtype([('step', '<i4'), ('agent', '<i4'), ('action', 'u1')])
+
+
+class _Buffer:
+    ''' Fixed size record buffer which is appended to a binary file when full. '''
+
+    def __init__(self, path, dtype, size):
+        self.path = path
+        self.data = np.zeros(size, dtype=dtype)
+        self.count = 0
+
+    def append(self, record):
+        self.data[self.count] = record
+        self.count += 1
+        if self.count == len(self.data):
+            self.flush()
+
+    def extend(self, records):
+        while len(records):
+            part = records[:len(self.data) - self.count]
+            self.data[self.count:self.count + len(part)] = part
+            self.count += len(part)
+            records = records[len(part):]
+            if self.count == len(self.data):
+                self.flush()
+
+    def flush(self):
+        if not self.count:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            self.data[:self.count].tofile(f)
+        self.count = 0
+
+
+def _flush(buffers):
+    for buf in buffers:
+        buf.flush()
+
+
+class StepLog:
+    '''
+    Buffered columnar log of a model run.
+
+    Step records and human actions are kept in memory and written in batches
+    to ``<path>.steps`` and ``<path>.actions`` as raw little endian records
+    (see STEP_DTYPE and ACTION_DTYPE). Buffers are flushed when full, on
+    close() and when the log is garbage collected or the interpreter exits.
+    '''
+
+    def __init__(self, path, level=ACTIONS, buffer_size=4096):
+        self.path = path
+        self.level = level
+        self.steps = _Buffer(path + '.steps', STEP_DTYPE, buffer_size)
+        self.actions = _Buffer(path + '.actions', ACTION_DTYPE, buffer_size)
+        self._finalizer = weakref.finalize(self, _flush, (self.steps, self.actions))
+        self.step_num = 0
+
+    def step(self, step, carbon, oxygen, temp, humans, plants):
+        if self.level < STEPS:
+            return
+        self.step_num = step
+        self.steps.append((step, carbon, oxygen, temp, humans, plants))
+
+    def steps_from(self, step, carbon, oxygen, temp, humans, plants):
+        ''' Record consecutive steps from step on at once; the values are arrays or constants. '''
+        if self.level < STEPS:
+            return
+        records = np.zeros(max(np.size(carbon), np.size(oxygen)), dtype=STEP_DTYPE)
+        records['step'] = step + np.arange(len(records))
+        records['carbon'] = carbon
+        records['oxygen'] = oxygen
+        records['temp'] = temp
+        records['humans'] = humans
+        records['plants'] = plants
+        self.step_num = int(records['step'][-1])
+        self.steps.extend(records)
+
+    def action(self, agent, action):
+        if self.level < ACTIONS:
+            return
+        self.actions.append((self.step_num, agent, action))
+
+    def flush(self):
+        _flush((self.steps, self.actions))
+
+    def close(self):
+        self._finalizer()
+
+    def __getstate__(self):
+        # Pickled (e.g. in a checkpoint) as its settings; buffered records are
+        # written out first so they are neither lost nor written twice
+        self.flush()
+        return {'path': self.path, 'level': self.level,
+                'buffer_size': len(self.steps.data), 'step_num': self.step_num}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['level'], state['buffer_size'])
+        self.step_num = state['step_num']
+
+
+def read_log(path):
+    ''' Load a log written by StepLog into a pair of structured arrays. '''
+    steps = np.zeros(0, dtype=STEP_DTYPE)
+    actions = np.zeros(0, dtype=ACTION_DTYPE)
+    if os.path.exists(path + '.steps'):
+        steps = np.fromfile(path + '.steps', dtype=STEP_DTYPE)
+    if os.path.exists(path + '.actions'):
+        actions = np.fromfile(path + '.actions', dtype=ACTION_DTYPE)
+    return steps, actions
+
+
+def to_text(path):
+    ''' Render a binary log in the plain text format of the original log files. '''
+    steps, actions = read_log(path)
+    bounds = np.searchsorted(actions['step'], steps['step'], side='left')
+    ends = np.searchsorted(actions['step'], steps['step'], side='right')
+    lines = []
+    for record, start, end in zip(steps, bounds, ends):
+        lines.append('\n\nStep {}:'.format(record['step']))
+        lines.append('\nCarbon Dioxide: {:f}'.format(record['carbon']))
+        lines.append('\nOxygen: {:f}'.format(record['oxygen']))
+        lines.append('\nTemperature: {:f}'.format(record['temp']))
+        lines.append('\nHuman Agents: {}'.format(record['humans']))
+        lines.append('\nPlant Agents: {}'.format(record['plants']))
+        for act in actions[start:end]:
+            name = ACTION_NAMES[act['action']]
+            lines.append('\nHuman {}\n{}'.format(act['agent'], name + '\n' if name else ''))
+    return ''.join(lines)
+
+
+if __name__ == '__main__':
+    for log_path in sys.argv[1:]:
+        print(to_text(log_path))
@@ -1,25 +1,62 @@
 from mesa import Agent, Model
-from mesa.space import MultiGrid
-from mesa.datacollection import DataCollector
 
 from ABM.schedule import RandomActivationBySpecies
+from ABM.space import make_grid
 from ABM.agents import Human, Plant
+from ABM.plants import PlantEngine, EventPlantEngine, MIN_CARBON
+from ABM.log import StepLog, ACTIONS
+from ABM.crops import get_crop
+from ABM.collect import SeriesCollector
 
+from operator import attrgetter
 import numpy as np
 import random
-import json
 import datetime
+import os
+
+RESOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+# Time series returned by SingleRoomModel.run_model
+SERIES = ('carbon', 'oxygen', 'temp', 'humans', 'plants')
+
+# Default habitat size in cells
+GRID_WIDTH = 20
+GRID_HEIGHT = 20
+
+# The scrubber removes SCRUB_RATE*(solar/400) carbon dioxide per step while
+# carbon dioxide is above SCRUB_LEVEL
+SCRUB_RATE = 0.415*0.041666
+SCRUB_LEVEL = 0.1
+
+
+# Reporters are module level functions rather than lambdas so models can be
+# pickled (see ABM/checkpoint.py)
+def human_count(model):
+    return model.schedule.get_agent_count(Human)
+
+
+def plant_count(model):
+    return model.schedule.get_agent_count(Plant)
+
 
 class SingleRoomModel(Model):
 
-    with open('ABM/resources/description.txt', 'r') as f:
+    with open(os.path.join(RESOURCE_DIR, 'description.txt'), 'r') as f:
         txt = f.read()
 
     description = (txt)
 
-    def __init__(self, scrubber,regrowth,excess_co2,excess_amount,solar,h_agents=1, p_agents=5, plants_spread=20,oxygen=21.21, carbon=0.13):
+    def __init__(self, scrubber,regrowth,excess_co2,excess_amount,solar,h_agents=1, p_agents=5, plants_spread=20,oxygen=21.21, carbon=0.13, log_level=ACTIONS, seed=None, crop='White Potato', width=GRID_WIDTH, height=GRID_HEIGHT, sparse=None, history=None, plant_events=True, strict=False):
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**32)
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.np_random = np.random.RandomState(seed % 2**32)
         self.schedule = RandomActivationBySpecies(self)
-        self.grid = MultiGrid(20, 20, torus=True)
+        self.width = width
+        self.height = height
+        self.grid = make_grid(width, height, torus=True, indexed=(Plant,), sparse=sparse,
+                              rng=self.random)
         self.oxygen = oxygen
         self.carbon = carbon
         self.h_agents = h_agents
@@ -33,59 +70,63 @@ class SingleRoomModel(Model):
         self.scrubber = scrubber
         self.stepNum = 1
         self.fileName = self.logfile()
+        self.log = StepLog(self.fileName, log_level)
 
-        with open('../data/data.json', 'r') as f:
-            data = json.load(f)
+        self.crop = crop
+        data = get_crop(crop)
+        self.oxy = float(data['Oxygen'])
+        self.co2 = float(data['Carbon'])
+        edible = float(data['Edible'])
+        inedible = float(data['Inedible'])
 
-        plant_type = 'White Potato'
-        self.oxy = data['Plants'][plant_type]['Oxygen']
-        self.co2 = data['Plants'][plant_type]['Carbon']
-        edible = data['Plants'][plant_type]['Edible']
-        inedible = data['Plants'][plant_type]['Inedible']
+        # Event driven plants by default; PlantEngine steps every plant each tick
+        self.plants = EventPlantEngine(self) if plant_events else PlantEngine(self)
+        self.schedule.add_engine(Plant, self.plants)
 
         for _ in range(self.p_agents):
-            coords = (random.randrange(0, 20), random.randrange(0, 20))
+            coords = (self.random.randrange(0, self.width), self.random.randrange(0, self.height))
             plant = Plant(coords,self.oxy,self.co2,self,self.spread)
             self.grid.place_agent(plant, coords)
             self.schedule.add(plant)
 
         for i in range(self.h_agents):
-            coords = (random.randrange(0, 20), random.randrange(0, 20))
+            coords = (self.random.randrange(0, self.width), self.random.randrange(0, self.height))
             human = Human(coords,i+1,edible,inedible,self)
             self.grid.place_agent(human, coords)
             self.schedule.add(human)
 
-        self.datacollector = DataCollector(
-            {"Human": lambda m: m.schedule.get_agent_count(Human),
-             "Plant": lambda m: m.schedule.get_agent_count(Plant)})
-
-        self.datacollector2 = DataCollector(
-            {"Carbon": lambda m: m.carbon}
-        )
+        # history: keep only that many steps (e.g. for the live server), None keeps all
+        self.series = SeriesCollector(
+            {"Human": human_count,
+             "Plant": plant_count,
+             "Carbon": attrgetter('carbon'),
+             "Oxygen": attrgetter('oxygen'),
+             "Temperature": attrgetter('temp')},
+            ring=history)
+        # Names the charts in server.py refer to
+        self.datacollector = self.series
+        self.datacollector2 = self.series
         self.running = True
 
+        # strict: always run every step, never extrapolate (see run_model)
+        self.strict = strict
+        self.fast_forward_step = None
+
     def logfile(self):
         time = datetime.datetime.now().strftime("%m-%d-%Y_%H:%M:%S")
-        return ("logs/" + time + ".txt")
+        return ("logs/" + time)
 
     def step(self):
-        with open(self.fileName,'a+') as f:
-            f.write('\n\nStep {}:'.format(self.stepNum))
-            f.write('\nCarbon Dioxide: {:f}'.format(self.carbon))
-            f.write('\nOxygen: {:f}'.format(self.oxygen))
-            f.write('\nTemperature: {:f}'.format(self.temp))
-            f.write('\nHuman Agents: {}'.format(self.h_agents))
-            f.write('\nPlant Agents: {}'.format(self.p_agents))
+        self.log.step(self.stepNum, self.carbon, self.oxygen, self.temp, self.h_agents, self.p_agents)
 
         self.schedule.step()
         if self.excess_co2:
             self.carbon += 0.001*(self.excess_amount)
-        if self.scrubber and self.carbon > 0.1:
-            self.carbon -= 0.415*0.041666*(self.solar/400)
+        if self.scrubber and self.carbon > SCRUB_LEVEL:
+            self.carbon -= SCRUB_RATE*(self.solar/400)
         if self.carbon < 0:
             self.carbon = 0
-        self.datacollector.collect(self)
-        self.datacollector2.collect(self)
+        self.series.collect(self)
 
         self.h_agents = self.schedule.get_agent_count(Human)
         self.p_agents = self.schedule.get_agent_count(Plant)
@@ -93,9 +134,145 @@ class SingleRoomModel(Model):
         self.stepNum += 1
 
     def run_model(self, step_count=200):
-        co2 = []
-        oxy = []
-        for i in range(step_count):
+        '''
+        Run step_count steps and return the SERIES as arrays.
+
+        Once the model is stationary (see stationary()) nothing random happens
+        any more and the gases change linearly, so the remaining steps are
+        extrapolated instead of run, up to the step in which plants would
+        start to die. fast_forward_step is then the number of the first
+        extrapolated step (None if every step was run). Extrapolated steps are
+        collected and logged like run ones, but do not draw random numbers;
+        pass strict=True to the model to run every step.
+        '''
+        series = {name: np.zeros(step_count) for name in SERIES}
+        self.fast_forward_step = None
+        i = 0
+        while i < step_count:
+            if not self.strict and self.stationary():
+                count = self._fast_forward(series, i, step_count - i)
+                if count:
+                    i += count
+                    continue
             self.step()
-            co2.append(self.carbon)
-            oxy.append(self.oxygen)
+            series['carbon'][i] = self.carbon
+            series['oxygen'][i] = self.oxygen
+            series['temp'][i] = self.temp
+            series['humans'][i] = self.h_agents
+            series['plants'][i] = self.p_agents
+            i += 1
+        return series
+
+    def stationary(self):
+        '''
+        True when the agent counts can only change through plants dying of
+        carbon dioxide starvation: every human is gone and plants cannot
+        spread (there are none, or regrowth is off).
+        '''
+        return (not self.schedule.get_agent_count(Human)
+                and not (self.regrowth and self.schedule.get_agent_count(Plant)))
+
+    def _fast_forward(self, series, start, steps):
+        ''' Extrapolate up to steps stationary steps into series[start:]; returns how many. '''
+        carbon = self._extrapolate_carbon(steps)
+        count = len(carbon)
+        if not count:
+            return 0
+        o2, _ = self.plants.totals()
+        oxygen = self.oxygen + o2*np.arange(1, count + 1)
+        plants = self.schedule.get_agent_count(Plant)
+
+        # Log records hold the state at the start of each step
+        self.log.steps_from(self.stepNum, np.r_[self.carbon, carbon[:-1]],
+                            np.r_[self.oxygen, oxygen[:-1]], self.temp, 0, plants)
+        self.series.extend({'Human': 0, 'Plant': plants, 'Carbon': carbon,
+                            'Oxygen': oxygen, 'Temperature': self.temp})
+        self.plants.advance(count)
+        self.carbon = float(carbon[-1])
+        self.oxygen = float(oxygen[-1])
+        self.h_agents = 0
+        self.p_agents = plants
+        if self.fast_forward_step is None:
+            self.fast_forward_step = self.stepNum
+        self.stepNum += count
+        # The event engine pops the wheel against the scheduler's step count
+        self.schedule.steps += count
+        self.schedule.time += count
+
+        end = start + count
+        series['carbon'][start:end] = carbon
+        series['oxygen'][start:end] = oxygen
+        series['temp'][start:end] = self.temp
+        series['humans'][start:end] = 0
+        series['plants'][start:end] = plants
+        return count
+
+    def _extrapolate_carbon(self, steps):
+        '''
+        Carbon dioxide after each of the next steps (at most steps) of a
+        stationary model, stopping before the first step in which a plant
+        would die.
+
+        Within a step the plants take up co2, excess_co2 adds excess, the
+        scrubber removes scrub above SCRUB_LEVEL and the level is clamped at
+        zero. While none of these conditions changes, carbon changes by the
+        same amount every step; each such stretch is extrapolated in one go,
+        and its last step is run exactly, as it may cross a threshold.
+        '''
+        plants = self.schedule.get_agent_count(Plant)
+        _, co2 = self.plants.totals()
+        excess = 0.001*self.excess_amount if self.excess_co2 else 0
+        scrub = SCRUB_RATE*(self.solar/400)
+
+        def steps_until(distance, rate):
+            # Whole steps, less one to allow for rounding, after which a value
+            # moving at rate towards a threshold distance away still has not
+            # reached it
+            if rate <= 0:
+                return steps
+            return max(int(distance // rate) - 1, 0)
+
+        carbon = np.empty(steps)
+        level = self.carbon
+        n = 0
+        while n < steps:
+            if plants and level - co2 < MIN_CARBON:
+                break
+            scrubbing = self.scrubber and level - co2 + excess > SCRUB_LEVEL
+            change = excess - co2 - (scrub if scrubbing else 0)
+            run = steps - n - 1
+            if plants:
+                run = min(run, steps_until(level - co2 - MIN_CARBON, -change))
+            if self.scrubber:
+                if scrubbing:
+                    run = min(run, steps_until(level - co2 + excess - SCRUB_LEVEL, -change))
+                else:
+                    run = min(run, steps_until(SCRUB_LEVEL - (level - co2 + excess), change))
+            run = min(run, steps_until(level + change, -change))
+            carbon[n:n + run] = level + change*np.arange(1, run + 1)
+            level += change*run
+            n += run
+
+            # One exact step
+            previous = level
+            level = level - co2 + excess
+            if self.scrubber and level > SCRUB_LEVEL:
+                level -= scrub
+            level = max(level, 0)
+            carbon[n] = level
+            n += 1
+            if level == previous:
+                # A fixed point, e.g. clamped at zero
+                carbon[n:] = level
+                n = steps
+        return carbon[:n]
+
+    def project(self, surrogate):
+        '''
+        Surrogate mode: run only the surrogate's warm-up steps and predict the
+        humans and plants alive at surrogate.horizon instead of stepping there.
+        '''
+        series = self.run_model(surrogate.warmup)
+        humans, plants = surrogate.predict(series)[0]
+        return {'humans': humans, 'plants': plants, 'step': surrogate.horizon,
+                'simulated_steps': surrogate.warmup, 'series': series}
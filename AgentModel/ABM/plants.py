@@ -0,0 +1,372 @@
+import numpy as np
+
+from ABM.events import TimerWheel
+
+# Fraction of a crop's daily gas exchange which happens in one (hourly) step
+OXYGEN_RATE = 0.0416*(3.369/1000)/32
+CARBON_RATE = 0.0416*(3.369/1000)/44
+
+# Plants die once carbon dioxide drops below this level
+MIN_CARBON = 0.015
+
+
+class Column:
+    '''
+    Attribute of an engine-backed agent.
+
+    While the agent is scheduled its value lives in the engine's arrays at
+    ``agent.slot``; before it is scheduled and after it is removed the value is
+    kept in ``agent.detached``.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, agent, owner):
+        if agent is None:
+            return self
+        if agent.slot is None:
+            return agent.detached[self.name]
+        return agent.engine.read(self.name, agent.slot)
+
+    def __set__(self, agent, value):
+        if agent.slot is None:
+            agent.detached[self.name] = value
+        else:
+            agent.engine.write(self.name, agent.slot, value)
+
+
+class PlantEngine:
+    '''
+    Structure-of-arrays store which steps every scheduled plant at once.
+
+    Plant state (position, maturity, turnCount, grown and gas rates) is kept in
+    NumPy arrays indexed by slot. step() applies maturation and gas exchange to
+    the whole population with array operations and only falls back to Python
+    for the plants which spread or die during the step.
+    '''
+
+    FIELDS = (('x', np.int32), ('y', np.int32), ('mature', np.int32), ('turnCount', np.int32),
+              ('grown', np.bool_), ('oxy', np.float64), ('co2', np.float64),
+              ('o2_rate', np.float64), ('co2_rate', np.float64), ('alive', np.bool_))
+
+    def __init__(self, model, capacity=64):
+        self.model = model
+        self.capacity = capacity
+        self.size = 0
+        self.free = []
+        self.agents = [None]*capacity
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return int(self.alive[:self.size].sum())
+
+    def _grow(self):
+        capacity = self.capacity*2
+        for name, dtype in self.FIELDS:
+            column = np.zeros(capacity, dtype=dtype)
+            column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self.agents.extend([None]*(capacity - self.capacity))
+        self.capacity = capacity
+
+    def read(self, name, slot):
+        if name == 'pos':
+            return (int(self.x[slot]), int(self.y[slot]))
+        return getattr(self, name)[slot].item()
+
+    def write(self, name, slot, value):
+        if name == 'pos':
+            self.x[slot], self.y[slot] = value
+            return
+        getattr(self, name)[slot] = value
+        if name == 'oxy':
+            self.o2_rate[slot] = value*OXYGEN_RATE
+        elif name == 'co2':
+            self.co2_rate[slot] = value*CARBON_RATE
+
+    def activate(self, agent):
+        ''' Move a plant's state into the arrays when it is scheduled. '''
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow()
+            slot = self.size
+            self.size += 1
+        self.agents[slot] = agent
+        self.alive[slot] = True
+        for name, value in agent.detached.items():
+            self.write(name, slot, value)
+        agent.slot = slot
+
+    def release(self, agent):
+        ''' Copy a plant's state back onto the agent when it is unscheduled. '''
+        slot = agent.slot
+        if slot is None:
+            return
+        agent.detached = {name: self.read(name, slot) for name in agent.detached}
+        agent.slot = None
+        self.agents[slot] = None
+        self.alive[slot] = False
+        self.free.append(slot)
+
+    def step(self, slots=None):
+        ''' Step the given slots in order, or every live plant in random order. '''
+        model = self.model
+        if slots is None:
+            live = np.flatnonzero(self.alive[:self.size])
+            slots = live[model.np_random.permutation(len(live))]
+        slots = np.asarray(slots, dtype=np.intp)
+        if not len(slots):
+            return
+
+        done = self.mature[slots] <= 0
+        self.grown[slots[done]] = True
+        self.mature[slots[~done]] -= 1
+
+        # Carbon is clamped at zero after every plant, and a plant dies if the
+        # carbon left after its own uptake is too low. Uptake is never negative
+        # so a running clamp is the same as clamping the cumulative sum.
+        model.oxygen += self.o2_rate[slots].sum()
+        carbon = np.maximum(model.carbon - np.cumsum(self.co2_rate[slots]), 0)
+        model.carbon = float(carbon[-1])
+        dying = slots[carbon < MIN_CARBON]
+
+        if model.regrowth:
+            self.turnCount[slots] -= 1
+            spreading = slots[self.turnCount[slots] <= 0]
+            self.turnCount[spreading] = model.spread
+            for slot in spreading:
+                self._spread(self.agents[slot])
+
+        for slot in dying:
+            plant = self.agents[slot]
+            model.grid._remove_agent(plant.pos, plant)
+            model.schedule.remove(plant)
+
+    def totals(self):
+        ''' Oxygen released and carbon dioxide taken up by all plants in one step. '''
+        live = self.alive[:self.size]
+        return (float(self.o2_rate[:self.size][live].sum()),
+                float(self.co2_rate[:self.size][live].sum()))
+
+    def advance(self, steps):
+        '''
+        Mature every plant as if it was stepped steps times, for steps in which
+        no plant spreads or dies (see SingleRoomModel.run_model).
+        '''
+        live = np.flatnonzero(self.alive[:self.size])
+        mature = self.mature[live]
+        self.grown[live[mature < steps]] = True
+        self.mature[live] = np.where(mature > 0, np.maximum(mature - steps, 0), mature)
+
+    def begin_step(self):
+        ''' Called by the scheduler before it steps agents one at a time. '''
+
+    def _spread(self, plant):
+        model = self.model
+        neighbors = model.grid.get_neighborhood(plant.pos, moore=False)
+        coords = model.schedule.empty_neighbor_finder(neighbors, type(plant))
+        if coords is None:
+            return
+        seedling = type(plant)(coords, plant.oxy, plant.co2, model, model.spread)
+        model.grid.place_agent(seedling, coords)
+        model.schedule.add(seedling)
+
+
+# Kinds of plant events
+MATURE, SPREAD = 0, 1
+
+
+class EventPlantEngine(PlantEngine):
+    '''
+    PlantEngine which only does work for the plants that change.
+
+    Maturation and spreading happen at steps which are known in advance, so
+    they are kept as events in a TimerWheel and fire when due; mature and
+    turnCount are worked out from the current step when read instead of being
+    counted down every step. Gas exchange is applied as one aggregate over
+    all plants, kept up to date as plants come and go. Only when carbon
+    dioxide is low enough for plants to die does a step visit every plant (in
+    random order, as PlantEngine does). A step therefore costs O(events)
+    rather than O(plants).
+
+    Plants stepped one at a time (Plant.step, or the scheduler with
+    by_type=False) take the events due at the current model step which
+    belong to them, and do their own gas exchange, as PlantEngine does.
+
+    Seeded runs draw random numbers differently from PlantEngine when the
+    whole population is stepped at once, so they follow different,
+    statistically equivalent, trajectories.
+    '''
+
+    # mature holds the step the plant matures at, and spread_at the step it
+    # next spreads at while regrowth is on (turnCount holds the count while
+    # it is off); gen changes whenever a slot's pending events become stale.
+    FIELDS = PlantEngine.FIELDS + (('spread_at', np.int64), ('gen', np.int64))
+
+    def __init__(self, model, capacity=64):
+        super().__init__(model, capacity)
+        self.wheel = TimerWheel()
+        self.tick = 0  # Model step the latest events popped from the wheel belong to
+        self.pending = {}  # slot -> events popped for single plant steps, not yet applied
+        self.regrowth = bool(model.regrowth)
+        self.o2_total = 0.0
+        self.co2_total = 0.0
+
+    def read(self, name, slot):
+        if name == 'mature':
+            return max(int(self.mature[slot]) - self.wheel.now, 0)
+        if name == 'turnCount' and self.regrowth:
+            return int(self.spread_at[slot]) - self.wheel.now + 1
+        return super().read(name, slot)
+
+    def write(self, name, slot, value):
+        now = self.wheel.now
+        if name == 'mature':
+            self.mature[slot] = now + max(value, 0)
+            self._schedule(MATURE, slot, int(self.mature[slot]))
+        elif name == 'turnCount' and self.regrowth:
+            self.spread_at[slot] = now + max(value - 1, 0)
+            self._schedule(SPREAD, slot, int(self.spread_at[slot]))
+        elif name in ('oxy', 'co2'):
+            o2_rate, co2_rate = self.o2_rate[slot], self.co2_rate[slot]
+            super().write(name, slot, value)
+            self.o2_total += self.o2_rate[slot] - o2_rate
+            self.co2_total += self.co2_rate[slot] - co2_rate
+        else:
+            super().write(name, slot, value)
+
+    def release(self, agent):
+        slot = agent.slot
+        if slot is None:
+            return
+        super().release(agent)
+        self.o2_total -= self.o2_rate[slot]
+        self.co2_total -= self.co2_rate[slot]
+        self.o2_rate[slot] = self.co2_rate[slot] = 0
+        self.gen[slot] += 1
+
+    def totals(self):
+        return self.o2_total, self.co2_total
+
+    def advance(self, steps):
+        if bool(self.model.regrowth) != self.regrowth:
+            self._set_regrowth(bool(self.model.regrowth))
+        for event in self._take_pending() + self.wheel.advance(steps):
+            if event[0] == MATURE and self._valid(event):
+                self.grown[event[1]] = True
+
+    def _take_pending(self):
+        events = [event for events in self.pending.values() for event in events]
+        self.pending = {}
+        return events
+
+    def _schedule(self, kind, slot, tick):
+        self.wheel.schedule(tick, (kind, slot, int(self.gen[slot]), tick))
+
+    def _valid(self, event):
+        kind, slot, gen, tick = event
+        if not self.alive[slot] or self.gen[slot] != gen:
+            return False
+        if kind == MATURE:
+            return self.mature[slot] == tick
+        return self.regrowth and self.spread_at[slot] == tick
+
+    def _set_regrowth(self, regrowth):
+        ''' Switch turnCount between counting down (events) and frozen. '''
+        now = self.wheel.now
+        live = np.flatnonzero(self.alive[:self.size])
+        if regrowth:
+            self.spread_at[live] = now + np.maximum(self.turnCount[live] - 1, 0)
+        else:
+            self.turnCount[live] = self.spread_at[live] - now + 1
+        self.regrowth = regrowth
+        # Drop every pending event and schedule the ones still wanted
+        self.gen[live] += 1
+        for slot in live:
+            self._schedule(MATURE, slot, int(self.mature[slot]))
+            if regrowth:
+                self._schedule(SPREAD, slot, int(self.spread_at[slot]))
+
+    def step(self, slots=None):
+        model = self.model
+        if bool(model.regrowth) != self.regrowth:
+            self._set_regrowth(bool(model.regrowth))
+        if slots is not None:
+            self._step_slots(slots)
+            return
+
+        tick = self.tick = self.wheel.now
+        due = [event for event in self._take_pending() + self.wheel.pop() if self._valid(event)]
+        if len(due) > 1:
+            due = [due[i] for i in model.np_random.permutation(len(due))]
+
+        for kind, slot, _, _ in due:
+            if kind == MATURE:
+                self.grown[slot] = True
+
+        model.oxygen += self.o2_total
+        dying = ()
+        if model.carbon - self.co2_total >= MIN_CARBON:
+            model.carbon -= self.co2_total
+        else:
+            # Some plants die: take them in random order as PlantEngine does
+            live = np.flatnonzero(self.alive[:self.size])
+            if len(live):
+                slots = live[model.np_random.permutation(len(live))]
+                carbon = np.maximum(model.carbon - np.cumsum(self.co2_rate[slots]), 0)
+                model.carbon = float(carbon[-1])
+                dying = slots[carbon < MIN_CARBON]
+
+        for kind, slot, _, _ in due:
+            if kind == SPREAD:
+                self.spread_at[slot] = tick + max(model.spread, 1)
+                self._schedule(SPREAD, slot, int(self.spread_at[slot]))
+                self._spread(self.agents[slot])
+
+        for slot in dying:
+            plant = self.agents[slot]
+            model.grid._remove_agent(plant.pos, plant)
+            model.schedule.remove(plant)
+
+    def begin_step(self):
+        '''
+        Pop the events of the current model step, once, for plants which will
+        be stepped one at a time. Plants added from then on belong to the
+        next step.
+        '''
+        if self.wheel.now <= self.model.schedule.steps:
+            self.tick = self.wheel.now
+            for event in self.wheel.pop():
+                self.pending.setdefault(event[1], []).append(event)
+
+    def _step_slots(self, slots):
+        ''' Step the given plants in order, as PlantEngine.step(slots) does. '''
+        model = self.model
+        self.begin_step()
+        for slot in slots:
+            slot = int(slot)
+            if not self.alive[slot]:
+                continue
+            due = [event for event in self.pending.pop(slot, ()) if self._valid(event)]
+            for kind, _, _, _ in due:
+                if kind == MATURE:
+                    self.grown[slot] = True
+
+            model.oxygen += self.o2_rate[slot]
+            model.carbon = max(model.carbon - self.co2_rate[slot], 0)
+            dying = model.carbon < MIN_CARBON
+
+            plant = self.agents[slot]
+            for kind, _, _, _ in due:
+                if kind == SPREAD:
+                    self.spread_at[slot] = self.tick + max(model.spread, 1)
+                    self._schedule(SPREAD, slot, int(self.spread_at[slot]))
+                    self._spread(plant)
+
+            if dying:
+                model.grid._remove_agent(plant.pos, plant)
+                model.schedule.remove(plant)
@@ -0,0 +1,241 @@
+import json
+import sys
+import time
+from collections import defaultdict
+
+from ABM.walk import Walker
+
+# Grid methods timed per call
+GRID_METHODS = ('place_agent', 'move_agent', 'remove_agent', 'get_neighborhood',
+                'get_cell_list_contents', 'is_cell_empty', 'nearest')
+
+
+class Profiler:
+    '''
+    Optional timing instrumentation for one model.
+
+    install() wraps the model's step, the scheduler, the grid, the data
+    collectors and the log with timing code, and uninstall() puts the original
+    methods back, so a model which is not being profiled runs exactly the
+    uninstrumented code. It records:
+
+    - wall time of every model step, of every species' turn within a step
+      and of data collection and logging, as trace spans;
+    - agent counts per species at every step;
+    - count, total and maximum time of every call to the hot-path helpers
+      (Walker.nearest_neighbor, empty_neighbor_finder and GRID_METHODS).
+      With trace_calls these calls are also kept as individual spans.
+
+    Times are inclusive: nearest_neighbor includes the grid.nearest call it
+    makes.
+
+        with Profiler(model) as profiler:
+            model.run_model(200)
+        profiler.write_trace('trace.json')   # open in chrome://tracing
+        print(profiler.summary())
+    '''
+
+    def __init__(self, model, calls=True, trace_calls=False):
+        self.model = model
+        self.calls = calls
+        self.trace_calls = trace_calls
+        self.events = []                            # (phase, name, category, start, duration, args)
+        self.stats = defaultdict(lambda: [0, 0.0, 0.0])  # call name -> [count, total, max]
+        self.species = defaultdict(list)            # species name -> seconds per step
+        self.counts = defaultdict(list)             # species name -> agents per step
+        self.origin = time.perf_counter()
+        self._patches = []
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    # Installation
+
+    def install(self):
+        if self._patches:
+            return
+        model = self.model
+        self._patch(model, 'step', self._span('step', 'model', model.step))
+        self._patch(model.schedule, 'step_type', self._species_step(model.schedule.step_type))
+        collectors = []
+        for name in ('series', 'datacollector', 'datacollector2'):
+            collector = getattr(model, name, None)
+            if collector is not None and not any(collector is c for c in collectors):
+                collectors.append(collector)
+                self._patch(collector, 'collect', self._span('collect', 'data', collector.collect))
+        log = getattr(model, 'log', None)
+        if log is not None:
+            self._patch(log, 'step', self._span('log', 'log', log.step))
+            self._patch(log, 'action', self._call('log.action', log.action))
+        if self.calls:
+            self._patch(model.schedule, 'empty_neighbor_finder',
+                        self._call('empty_neighbor_finder', model.schedule.empty_neighbor_finder))
+            for name in GRID_METHODS:
+                method = getattr(model.grid, name, None)
+                if method is not None:
+                    self._patch(model.grid, name, self._call('grid.' + name, method))
+            self._patch_class(Walker, 'nearest_neighbor', 'nearest_neighbor')
+
+    def uninstall(self):
+        while self._patches:
+            owner, name, original = self._patches.pop()
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+
+    def _patch(self, obj, name, wrapper):
+        # Instance attribute shadowing the class method; removed again on uninstall
+        self._patches.append((obj, name, obj.__dict__.get(name)))
+        setattr(obj, name, wrapper)
+
+    def _patch_class(self, cls, name, label):
+        original = cls.__dict__[name]
+        timed = self._call(label, original)
+        model = self.model
+
+        def wrapper(agent, *args, **kwargs):
+            if agent.model is model:
+                return timed(agent, *args, **kwargs)
+            return original(agent, *args, **kwargs)
+
+        self._patches.append((cls, name, original))
+        setattr(cls, name, wrapper)
+
+    # Wrappers
+
+    def _span(self, name, category, func):
+        events = self.events
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                events.append(('X', name, category, start, clock() - start, None))
+        return wrapper
+
+    def _call(self, name, func):
+        stats = self.stats[name]
+        events = self.events if self.trace_calls else None
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+                if events is not None:
+                    events.append(('X', name, 'call', start, elapsed, None))
+        return wrapper
+
+    def _species_step(self, step_type):
+        schedule = self.model.schedule
+        events = self.events
+        clock = time.perf_counter
+
+        def wrapper(species):
+            name = species.__name__
+            count = len(schedule.agents_by_type[species])
+            start = clock()
+            try:
+                return step_type(species)
+            finally:
+                elapsed = clock() - start
+                self.species[name].append(elapsed)
+                self.counts[name].append(count)
+                events.append(('X', name, 'species', start, elapsed, {'agents': count}))
+                events.append(('C', 'agents', 'species', start, 0, {name: count}))
+        return wrapper
+
+    # Results
+
+    def trace(self):
+        ''' The recorded events in Chrome trace event format. '''
+        events = []
+        for phase, name, category, start, duration, args in self.events:
+            event = {'name': name, 'cat': category, 'ph': phase, 'pid': 0, 'tid': 0,
+                     'ts': (start - self.origin)*1e6}
+            if phase == 'X':
+                event['dur'] = duration*1e6
+            if args:
+                event['args'] = args
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f)
+
+    def span_table(self):
+        ''' One row per species turn, data collection and logging, with per-step times. '''
+        totals = defaultdict(list)
+        for phase, name, category, start, duration, args in self.events:
+            if phase == 'X' and category != 'call':
+                totals[name].append(duration)
+        step_time = sum(totals.pop('step', [])) or 1.0
+        rows = []
+        for name, times in totals.items():
+            counts = self.counts.get(name)
+            rows.append({'name': name, 'calls': len(times), 'total_ms': 1e3*sum(times),
+                         'mean_ms': 1e3*sum(times)/len(times), 'max_ms': 1e3*max(times),
+                         'share': sum(times)/step_time,
+                         'mean_agents': sum(counts)/len(counts) if counts else None,
+                         'max_agents': max(counts) if counts else None})
+        rows.sort(key=lambda row: -row['total_ms'])
+        return rows
+
+    def call_table(self):
+        ''' One row per instrumented helper, with call counts and times. '''
+        rows = [{'name': name, 'calls': count, 'total_ms': 1e3*total,
+                 'mean_us': 1e6*total/count, 'max_us': 1e6*longest}
+                for name, (count, total, longest) in self.stats.items() if count]
+        rows.sort(key=lambda row: -row['total_ms'])
+        return rows
+
+    def summary(self):
+        steps = [e[4] for e in self.events if e[0] == 'X' and e[1] == 'step']
+        lines = ['{} steps, {:.1f} ms total, {:.3f} ms per step'.format(
+            len(steps), 1e3*sum(steps), 1e3*sum(steps)/len(steps) if steps else 0)]
+        lines.append('')
+        lines.append('{:<28}{:>8}{:>12}{:>10}{:>10}{:>8}{:>12}'.format(
+            'span', 'calls', 'total ms', 'mean ms', 'max ms', 'share', 'agents'))
+        for row in self.span_table():
+            agents = '' if row['mean_agents'] is None else '{:.1f}/{}'.format(
+                row['mean_agents'], row['max_agents'])
+            lines.append('{:<28}{:>8}{:>12.2f}{:>10.3f}{:>10.3f}{:>7.1%}{:>12}'.format(
+                row['name'], row['calls'], row['total_ms'], row['mean_ms'], row['max_ms'],
+                row['share'], agents))
+        calls = self.call_table()
+        if calls:
+            lines.append('')
+            lines.append('{:<28}{:>8}{:>12}{:>10}{:>10}'.format(
+                'call', 'calls', 'total ms', 'mean us', 'max us'))
+            for row in calls:
+                lines.append('{:<28}{:>8}{:>12.2f}{:>10.2f}{:>10.1f}'.format(
+                    row['name'], row['calls'], row['total_ms'], row['mean_us'], row['max_us']))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from ABM.batch import DEFAULTS
+    from ABM.log import OFF
+    from ABM.model import SingleRoomModel
+
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    model = SingleRoomModel(**dict(DEFAULTS, log_level=OFF, seed=0))
+    with Profiler(model) as profiler:
+        model.run_model(steps)
+    if len(sys.argv) > 2:
+        profiler.write_trace(sys.argv[2])
+    print(profiler.summary())
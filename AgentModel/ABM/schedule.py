@@ -4,27 +4,94 @@ from collections import defaultdict
 from mesa.time import RandomActivation
 
 
+class AgentSlots:
+    '''
+    Agent list with O(1) membership tests and removal.
+
+    Each agent's position in ``items`` is tracked in ``slots``; removing an
+    agent moves the last agent into the freed slot. Iteration order is
+    therefore arbitrary, activation order comes from shuffled().
+    '''
+
+    def __init__(self):
+        self.items = []
+        self.slots = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, i):
+        return self.items[i]
+
+    def __contains__(self, agent):
+        return agent in self.slots
+
+    def append(self, agent):
+        if agent in self.slots:
+            return
+        self.slots[agent] = len(self.items)
+        self.items.append(agent)
+
+    def remove(self, agent):
+        i = self.slots.pop(agent)
+        last = self.items.pop()
+        if last is not agent:
+            self.items[i] = last
+            self.slots[last] = i
+
+    def discard(self, agent):
+        if agent in self.slots:
+            self.remove(agent)
+
+    def shuffled(self, rng=random):
+        order = list(self.items)
+        rng.shuffle(order)
+        return order
+
+
 class RandomActivationBySpecies(RandomActivation):
 
-    agents_by_type = defaultdict(list)
+    agents_by_type = defaultdict(AgentSlots)
 
     def __init__(self, model):
         super().__init__(model)
-        self.agents_by_type = defaultdict(list)
+        self.agents = AgentSlots()
+        self.agents_by_type = defaultdict(AgentSlots)
+        self.engines = {}
+
+    def add_engine(self, type_class, engine):
+        ''' Let engine step every agent of type_class in bulk (see PlantEngine). '''
+        self.engines[type_class] = engine
 
     def add(self, agent):
         self.agents.append(agent)
         agent_class = type(agent)
         self.agents_by_type[agent_class].append(agent)
+        engine = self.engines.get(agent_class)
+        if engine is not None:
+            engine.activate(agent)
+        index = self.spatial_index(agent_class)
+        if index is not None:
+            index.add(agent, agent.pos)
 
     def remove(self, agent):
+        self.agents.discard(agent)
+        agent_class = type(agent)
+        self.agents_by_type[agent_class].discard(agent)
+        engine = self.engines.get(agent_class)
+        if engine is not None:
+            engine.release(agent)
 
-        while agent in self.agents:
-            self.agents.remove(agent)
+        index = self.spatial_index(agent_class)
+        if index is not None:
+            index.discard(agent)
 
-        agent_class = type(agent)
-        while agent in self.agents_by_type[agent_class]:
-            self.agents_by_type[agent_class].remove(agent)
+    def spatial_index(self, type_class):
+        grid = getattr(self.model, 'grid', None)
+        return getattr(grid, 'index', {}).get(type_class)
 
     def step(self, by_type=True):
         if by_type:
@@ -33,15 +100,26 @@ class RandomActivationBySpecies(RandomActivation):
             self.steps += 1
             self.time += 1
         else:
-            super().step()
+            for engine in self.engines.values():
+                engine.begin_step()
+            for agent in self.agents.shuffled(self.model.random):
+                if agent in self.agents:
+                    agent.step()
+            self.steps += 1
+            self.time += 1
 
     def step_type(self, species):
+        if species in self.engines:
+            self.engines[species].step()
+            return
 
+        # Step a shuffled snapshot; agents removed during the step are skipped
+        # and agents added during the step wait for the next one.
         agents = self.agents_by_type[species]
-        random.shuffle(agents)
 
-        for agent in agents:
-            agent.step()
+        for agent in agents.shuffled(self.model.random):
+            if agent in agents:
+                agent.step()
 
 
     def get_agent_count(self, type_class):
@@ -51,11 +129,11 @@ class RandomActivationBySpecies(RandomActivation):
     def get_random_agent(self, type_class):
 
         agents = self.agents_by_type[type_class]
-        return agents[random.randint(0,self.get_agent_count(type_class)-1)]
+        return agents[self.model.random.randint(0,self.get_agent_count(type_class)-1)]
 
     def empty_neighbor_finder(self, neighbors, type_class):
-        random.shuffle(neighbors)
+        self.model.random.shuffle(neighbors)
         for neighbor in neighbors:
             this_cell = self.model.grid.get_cell_list_contents([neighbor])
-            if not(isinstance(this_cell, type_class)):
+            if not any(isinstance(obj, type_class) for obj in this_cell):
                 return neighbor
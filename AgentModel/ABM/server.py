@@ -3,7 +3,8 @@ from mesa.visualization.modules import CanvasGrid, ChartModule
 from mesa.visualization.UserParam import UserSettableParameter
 
 from ABM.agents import Human, Plant
-from ABM.model import SingleRoomModel
+from ABM.model import SingleRoomModel, GRID_WIDTH, GRID_HEIGHT
+from ABM.crops import crop_names
 
 
 def single_room(agent):
@@ -30,7 +31,34 @@ def single_room(agent):
 
     return portrayal
 
-canvas_element = CanvasGrid(single_room, 20, 20, 500, 500)
+class HabitatCanvas(CanvasGrid):
+    '''
+    CanvasGrid which only visits occupied cells, see HabitatGrid.occupied.
+
+    Habitats larger than grid_width x grid_height are drawn scaled down, so
+    one canvas cell shows every kind of agent in a block of habitat cells.
+    '''
+
+    def render(self, model):
+        scale_x = self.grid_width / model.grid.width
+        scale_y = self.grid_height / model.grid.height
+        grid_state = {}
+        drawn = set()
+        for (x, y), agents in model.grid.occupied():
+            x, y = int(x*scale_x), int(y*scale_y)
+            for obj in agents:
+                portrayal = self.portrayal_method(obj)
+                if portrayal:
+                    key = (x, y, tuple(sorted(portrayal.items())))
+                    if key in drawn:
+                        continue
+                    drawn.add(key)
+                    portrayal["x"] = x
+                    portrayal["y"] = y
+                    grid_state.setdefault(portrayal["Layer"], []).append(portrayal)
+        return grid_state
+
+canvas_element = HabitatCanvas(single_room, GRID_WIDTH, GRID_HEIGHT, 500, 500)
 
 
 chart_element = ChartModule([{"Label": "Human", "Color": "#AA0000"},
@@ -50,6 +78,10 @@ server = ModularServer(SingleRoomModel, [canvas_element, chart_element, chart_ga
                            h_agents=UserSettableParameter('slider', 'Initial Human Population', 1, 0, 10),
                            p_agents=UserSettableParameter('slider', 'Initial Plant Population', 5, 0, 100),
                            regrowth=UserSettableParameter('checkbox', 'Plant Regrowth Enabled', False),
-                           plants_spread=UserSettableParameter('slider', 'Plants Spread Rate (Steps)', 20, 1, 50, description="The number of steps it takes for a plant to spread.")
+                           plants_spread=UserSettableParameter('slider', 'Plants Spread Rate (Steps)', 20, 1, 50, description="The number of steps it takes for a plant to spread."),
+                           crop=UserSettableParameter('choice', 'Crop', value='White Potato', choices=crop_names()),
+                           width=UserSettableParameter('slider', 'Habitat Width (cells)', GRID_WIDTH, GRID_WIDTH, 200, 10),
+                           height=UserSettableParameter('slider', 'Habitat Height (cells)', GRID_HEIGHT, GRID_HEIGHT, 200, 10),
+                           history=10000    # Steps of chart data kept per model
                            )
                        )
@@ -0,0 +1,268 @@
+import itertools
+import random
+from math import hypot
+
+from mesa.space import MultiGrid
+
+# Grids with more cells than this default to SparseHabitatGrid (see make_grid)
+SPARSE_CELLS = 10000
+
+
+def grid_distance(pos1, pos2, width, height, torus):
+    dx = abs(pos1[0] - pos2[0])
+    dy = abs(pos1[1] - pos2[1])
+    if torus:
+        dx = min(dx, width - dx)
+        dy = min(dy, height - dy)
+    return hypot(dx, dy)
+
+
+class SpatialIndex:
+    '''
+    Bucketed index of agent positions for nearest neighbour queries.
+
+    The grid is split into square buckets of ``bucket`` cells. A query scans
+    rings of buckets outward from the query position and stops as soon as no
+    unscanned bucket can hold a closer agent, so its cost depends on the local
+    density rather than the number of indexed agents. Distances wrap around
+    the edges when ``torus`` is set.
+    '''
+
+    def __init__(self, width, height, torus, bucket=4):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.bucket = bucket
+        self.x_buckets = -(-width // bucket)
+        self.y_buckets = -(-height // bucket)
+        self.buckets = {}
+        self.where = {}
+        # On a torus the last row/column of buckets may be narrower
+        self.slack = 0
+        if torus:
+            self.slack = max(self.x_buckets * bucket - width, self.y_buckets * bucket - height)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, agent):
+        return agent in self.where
+
+    def _key(self, pos):
+        x, y = pos
+        return (x // self.bucket, y // self.bucket)
+
+    def add(self, agent, pos):
+        if agent in self.where:
+            self.discard(agent)
+        key = self._key(pos)
+        self.buckets.setdefault(key, {})[agent] = pos
+        self.where[agent] = key
+
+    def move(self, agent, pos):
+        key = self._key(pos)
+        old = self.where[agent]
+        if old == key:
+            self.buckets[key][agent] = pos
+            return
+        bucket = self.buckets[old]
+        del bucket[agent]
+        if not bucket:
+            del self.buckets[old]
+        self.buckets.setdefault(key, {})[agent] = pos
+        self.where[agent] = key
+
+    def discard(self, agent):
+        key = self.where.pop(agent, None)
+        if key is None:
+            return
+        bucket = self.buckets[key]
+        del bucket[agent]
+        if not bucket:
+            del self.buckets[key]
+
+    def distance(self, pos1, pos2):
+        return grid_distance(pos1, pos2, self.width, self.height, self.torus)
+
+    def _ring(self, key, r):
+        bx, by = key
+        if r == 0:
+            yield key
+            return
+        for i in range(-r, r + 1):
+            for j in (-r, r):
+                yield (bx + i, by + j)
+            if -r < i < r:
+                continue
+            for j in range(-r + 1, r):
+                yield (bx + i, by + j)
+
+    def nearest(self, pos):
+        ''' Return the indexed agent closest to pos, or None if the index is empty. '''
+        if not self.where:
+            return None
+        center = self._key(pos)
+        max_ring = max(self.x_buckets, self.y_buckets)
+        seen = set()
+        nearest = None
+        min_dist = None
+        for r in range(max_ring + 1):
+            for bx, by in self._ring(center, r):
+                if self.torus:
+                    bx %= self.x_buckets
+                    by %= self.y_buckets
+                elif not (0 <= bx < self.x_buckets and 0 <= by < self.y_buckets):
+                    continue
+                if (bx, by) in seen:
+                    continue
+                seen.add((bx, by))
+                for agent, agent_pos in self.buckets.get((bx, by), {}).items():
+                    dist = self.distance(pos, agent_pos)
+                    if min_dist is None or dist < min_dist:
+                        min_dist = dist
+                        nearest = agent
+            # Anything beyond ring r is at least r*bucket cells away
+            if nearest is not None and min_dist <= r * self.bucket - self.slack:
+                break
+        return nearest
+
+
+class HabitatGrid(MultiGrid):
+    '''
+    MultiGrid which keeps a SpatialIndex per indexed agent type.
+
+    The scheduler decides which agents are in an index (see
+    RandomActivationBySpecies.add/remove); the grid keeps their positions up
+    to date as they are placed and moved.
+    '''
+
+    def __init__(self, width, height, torus, indexed=(), rng=None):
+        super().__init__(width, height, torus)
+        self.index = {agent_type: SpatialIndex(width, height, torus) for agent_type in indexed}
+        # The model's random.Random, so seeded models do not share the global one
+        self.random = rng or random
+
+    def _place_agent(self, pos, agent):
+        super()._place_agent(pos, agent)
+        self._update_index(pos, agent)
+
+    def _update_index(self, pos, agent):
+        index = self.index.get(type(agent))
+        if index is not None and agent in index:
+            index.move(agent, pos)
+
+    def occupied(self):
+        ''' Iterate over (pos, agents) for every cell holding at least one agent. '''
+        for agents, x, y in self.coord_iter():
+            if agents:
+                yield (x, y), agents
+
+    def find_empty(self):
+        ''' Pick a random empty cell, or return None if there is none. '''
+        if not self.exists_empty_cells():
+            return None
+        return self.random.choice(self.empties)
+
+    def distance(self, pos1, pos2):
+        return grid_distance(pos1, pos2, self.width, self.height, self.torus)
+
+    def nearest(self, pos, agent_type):
+        return self.index[agent_type].nearest(pos)
+
+
+class _SparseColumn:
+    ''' grid[x] of a SparseHabitatGrid, so that grid[x][y] works as on MultiGrid. '''
+
+    def __init__(self, cells, x):
+        self.cells = cells
+        self.x = x
+
+    def __getitem__(self, y):
+        return self.cells.get((self.x, y), _EMPTY)
+
+
+_EMPTY = frozenset()
+
+
+class SparseHabitatGrid(HabitatGrid):
+    '''
+    HabitatGrid which only stores occupied cells.
+
+    MultiGrid allocates a set for every cell and keeps a list of the empty
+    ones, so its memory, construction time and the cost of placing an agent
+    grow with the area. Here cells live in a dict from position to the set of
+    agents and disappear when they empty, so both depend on the number of
+    agents instead. Iterating over the grid (iter, coord_iter) only visits
+    occupied cells, and empty cells read as an empty frozenset.
+    '''
+
+    def __init__(self, width, height, torus, indexed=(), rng=None):
+        # MultiGrid.__init__ would allocate every cell
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.cells = {}
+        self.index = {agent_type: SpatialIndex(width, height, torus) for agent_type in indexed}
+        self.random = rng or random
+
+    def __getitem__(self, x):
+        return _SparseColumn(self.cells, x)
+
+    def __iter__(self):
+        return iter(list(self.cells.values()))
+
+    def coord_iter(self):
+        for (x, y), agents in list(self.cells.items()):
+            yield agents, x, y
+
+    def occupied(self):
+        return iter(list(self.cells.items()))
+
+    def _place_agent(self, pos, agent):
+        agents = self.cells.get(pos)
+        if agents is None:
+            agents = self.cells[pos] = set()
+        agents.add(agent)
+        self._update_index(pos, agent)
+
+    def _remove_agent(self, pos, agent):
+        agents = self.cells[pos]
+        agents.remove(agent)
+        if not agents:
+            del self.cells[pos]
+
+    def is_cell_empty(self, pos):
+        return pos not in self.cells
+
+    def iter_cell_list_contents(self, cell_list):
+        if isinstance(cell_list, tuple):
+            cell_list = [cell_list]
+        cells = self.cells
+        return itertools.chain.from_iterable(cells[pos] for pos in cell_list if pos in cells)
+
+    def get_cell_list_contents(self, cell_list):
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def exists_empty_cells(self):
+        return len(self.cells) < self.width * self.height
+
+    def find_empty(self):
+        ''' Pick a random empty cell, or return None if there is none. '''
+        if not self.exists_empty_cells():
+            return None
+        while True:
+            pos = (self.random.randrange(self.width), self.random.randrange(self.height))
+            if pos not in self.cells:
+                return pos
+
+
+def make_grid(width, height, torus=True, indexed=(), sparse=None, rng=None):
+    '''
+    Build the habitat grid. sparse=None picks SparseHabitatGrid for grids of
+    more than SPARSE_CELLS cells; rng is the random.Random it draws cells
+    with (default: the random module).
+    '''
+    if sparse is None:
+        sparse = width * height > SPARSE_CELLS
+    grid_class = SparseHabitatGrid if sparse else HabitatGrid
+    return grid_class(width, height, torus, indexed, rng)
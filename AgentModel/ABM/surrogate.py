@@ -0,0 +1,128 @@
+"""
+Surrogate mode: predict the outcome of a run from its first steps.
+
+SingleRoomModel.project still simulates the warm-up (window*interval steps)
+and only skips the steps from there to the horizon, so it saves at most
+horizon/warmup of the run time. With the defaults, the layout of
+trainData.csv, that is 120 of 200 steps: at most 1.7x, and about 1.6x in
+validate over a grid of parameters. A shorter window or a longer horizon
+(Surrogate's window and horizon, generate.py --window and --horizon for
+matching training data) gives more, e.g. about 3.5x with a window of 6.
+"""
+import time
+
+import numpy as np
+
+from ABM.batch import run_batch
+
+# Layout of the learning data (see LearningModel/generate.py): WINDOW oxygen
+# and WINDOW carbon samples taken every INTERVAL steps, then the humans and
+# plants alive at step HORIZON.
+WINDOW = 12
+INTERVAL = 10
+HORIZON = 200
+TARGETS = ('humans', 'plants')
+
+
+def features(series, window=WINDOW, interval=INTERVAL):
+    ''' Oxygen and carbon samples of one or more runs, as (runs, 2*window). '''
+    samples = np.arange(1, window + 1)*interval - 1
+    oxygen = np.atleast_2d(series['oxygen'])[:, samples]
+    carbon = np.atleast_2d(series['carbon'])[:, samples]
+    return np.hstack([oxygen, carbon])
+
+
+def outcomes(series):
+    ''' Humans and plants at the end of one or more runs, as (runs, 2). '''
+    return np.column_stack([np.atleast_2d(series[name])[:, -1] for name in TARGETS])
+
+
+class Surrogate:
+    '''
+    Predicts the outcome of a run at `horizon` from its first window*interval
+    steps.
+
+    Args:
+        predict: Callable mapping an (n, features) array to (n, 2) predictions
+                 of the humans and plants alive at the horizon.
+        inputs: Columns of the feature window the predictor was trained on,
+                e.g. slice(0, 23) for the networks in LearningModel.
+    '''
+
+    def __init__(self, predict, inputs=slice(None), window=WINDOW, interval=INTERVAL, horizon=HORIZON):
+        if window*interval >= horizon:
+            raise ValueError('a warm-up of {} steps does not end before the horizon {}'.format(
+                window*interval, horizon))
+        self.predict_fn = predict
+        self.inputs = inputs
+        self.window = window
+        self.interval = interval
+        self.horizon = horizon
+
+    @property
+    def warmup(self):
+        return self.window*self.interval
+
+    @classmethod
+    def from_keras(cls, model, inputs=slice(0, 23), **kwargs):
+        return cls(lambda x: model.predict(x), inputs, **kwargs)
+
+    def predict(self, series):
+        ''' Predict outcomes from the (warm-up) series of one or more runs. '''
+        x = features(series, self.window, self.interval)[:, self.inputs]
+        return np.maximum(np.asarray(self.predict_fn(x), dtype=float).reshape(len(x), -1), 0)
+
+
+class LinearSurrogate(Surrogate):
+    ''' Least squares predictor which needs nothing beyond NumPy. '''
+
+    def __init__(self, coef, **kwargs):
+        self.coef = coef
+        super().__init__(self._predict, **kwargs)
+
+    def _predict(self, x):
+        return np.hstack([x, np.ones((len(x), 1))]) @ self.coef
+
+    @classmethod
+    def fit(cls, data, inputs=None, targets=None, **kwargs):
+        '''
+        Fit to rows in the learning data layout (e.g. from LearningModel/dataset.py),
+        generated with the same window (keyword argument, default WINDOW).
+        '''
+        window = kwargs.get('window', WINDOW)
+        inputs = slice(0, 2*window) if inputs is None else inputs
+        targets = slice(2*window, 2*window + 2) if targets is None else targets
+        data = np.asarray(data[:])
+        x = np.hstack([data[:, inputs], np.ones((len(data), 1))])
+        coef = np.linalg.lstsq(x, data[:, targets], rcond=None)[0]
+        return cls(coef, inputs=inputs, **kwargs)
+
+
+def validate(surrogate, params, replicates=1, processes=None, seed=0):
+    '''
+    Compare surrogate predictions against full runs.
+
+    Every parameter set is run to the surrogate's horizon and, with the same
+    seeds, for its warm-up steps only; the warm-up runs are fed to the
+    surrogate. Returns the
+    error per target and the wall time of both.
+    '''
+    start = time.time()
+    full = run_batch(params, replicates, surrogate.horizon, processes, seed)
+    full_time = time.time() - start
+
+    start = time.time()
+    warm = run_batch(params, replicates, surrogate.warmup, processes, seed)
+    predicted = surrogate.predict(warm.series)
+    surrogate_time = time.time() - start
+
+    actual = outcomes(full.series)
+    error = predicted - actual
+    report = {'runs': len(full), 'full_time': full_time, 'surrogate_time': surrogate_time,
+              'speedup': full_time/surrogate_time if surrogate_time else float('inf'),
+              'predicted': predicted, 'actual': actual}
+    for i, name in enumerate(TARGETS):
+        report[name] = {'mae': float(np.abs(error[:, i]).mean()),
+                        'rmse': float(np.sqrt((error[:, i]**2).mean())),
+                        'bias': float(error[:, i].mean())}
+    return report
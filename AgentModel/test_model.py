@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ABM.agents import Plant
+from ABM.batch import DEFAULTS
+from ABM.log import OFF
+from ABM.model import SingleRoomModel
+
+
+def plant_state(model):
+    return sorted((plant.pos, plant.mature, plant.grown, plant.turnCount)
+                  for plant in model.schedule.agents_by_type[Plant])
+
+
+def test_single_steps_after_fast_forward_match_strict_run():
+    for seed in range(3):
+        models = [SingleRoomModel(log_level=OFF, seed=seed, strict=strict,
+                                  **dict(DEFAULTS, h_agents=0, p_agents=10, carbon=2))
+                  for strict in (True, False)]
+        for model in models:
+            model.run_model(5)
+        strict, fast = models
+        assert fast.fast_forward_step is not None
+        assert fast.schedule.steps == strict.schedule.steps
+
+        # Agent by agent activation pops the plant events per scheduler step
+        for _ in range(30):
+            for model in models:
+                model.schedule.step(by_type=False)
+        assert plant_state(fast) == plant_state(strict)
+        assert np.isclose(fast.carbon, strict.carbon)
+        assert np.isclose(fast.oxygen, strict.oxygen)
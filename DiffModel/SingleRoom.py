@@ -1,4 +1,8 @@
-import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import engine
 
 class People(object):
     def __init__(self,number=0):
@@ -53,29 +57,26 @@ class Plant(object):
 oxygen = 21.21
 carbon = 0.15
 
-area = input("Area of crops (in m^2): ")
+def main():
+    import matplotlib.pyplot as plt
 
-# Initialize one People object
-person = People(1)
-wheat = Plant(area)
+    area = float(input("Area of crops (in m^2): "))
 
-totOxy = []
-totCarbon = []
+    # One person and one crop area; each day is one step of the engine
+    days = 100
+    result = engine.simulate(area, people=1, oxygen=oxygen, carbon=carbon, days=days)
+    totOxy = result.oxygen[0]
+    totCarbon = result.carbon[0]
 
-for i in range(100): # Each iteration is a day
-    oxygen, carbon = person.breath(oxygen,carbon)
-    oxygen, carbon = wheat.breath(oxygen,carbon)
-    if (carbon>0.53):
-        person.remove()
-    totOxy.append(oxygen)
-    totCarbon.append(carbon)
+    plt.plot(range(days),totOxy, 'r', label="Oxygen")
+    plt.plot(range(days),totCarbon, 'g', label="Carbon Dioxide")
+    plt.xlabel('Time (Days)')
+    plt.ylabel('Gas (kPa)')
+    plt.title('Oxygen and Carbon Dioxide')
+    plt.grid(True)
+    plt.legend(loc='best')
 
-plt.plot(range(100),totOxy, 'r', label="Oxygen")
-plt.plot(range(100),totCarbon, 'g', label="Carbon Dioxide")
-plt.xlabel('Time (Days)')
-plt.ylabel('Gas (kPa)')
-plt.title('Oxygen and Carbon Dioxide')
-plt.grid(True)
-plt.legend(loc='best')
+    plt.show()
 
-plt.show()
+if __name__ == "__main__":
+    main()
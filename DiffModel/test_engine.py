@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import engine
+
+
+def reference(area, people, oxygen, carbon, days):
+    ''' The day by day loop of the original SingleRoom.py, for any crew size. '''
+    oxygen_t, carbon_t, people_t = [], [], []
+    loss_day = -1
+    for day in range(days):
+        carbon += people*engine.PERSON_CARBON - area*engine.CROP_CARBON
+        oxygen += area*engine.CROP_OXYGEN - people*engine.PERSON_OXYGEN
+        if carbon > engine.CREW_LOSS_CARBON and people > 0:
+            people -= 1
+            if loss_day < 0:
+                loss_day = day
+        oxygen_t.append(oxygen)
+        carbon_t.append(carbon)
+        people_t.append(people)
+    return oxygen_t, carbon_t, people_t, loss_day
+
+
+def test_matches_reference_loop():
+    rng = np.random.RandomState(0)
+    n, days = 5000, 100
+    area = rng.uniform(0, 60, n)
+    people = rng.randint(0, 6, n)
+    carbon = rng.uniform(0.1, 0.7, n)
+    result = engine.simulate(area, people, 21.21, carbon, days)
+    for i in range(n):
+        oxygen_t, carbon_t, people_t, loss_day = reference(area[i], people[i], 21.21, carbon[i], days)
+        np.testing.assert_allclose(result.carbon[i], carbon_t, atol=1e-9)
+        np.testing.assert_allclose(result.oxygen[i], oxygen_t, atol=1e-9)
+        np.testing.assert_array_equal(result.people[i], people_t)
+        assert result.loss_day[i] == loss_day
+
+
+def test_loss_can_bring_carbon_back_under_threshold():
+    result = engine.simulate(24.7, 2, carbon=0.539, days=5)
+    assert result.loss_day[0] == 0
+    assert list(result.people[0]) == [1]*5
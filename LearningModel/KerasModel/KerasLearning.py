@@ -1,12 +1,17 @@
 from keras.models import Sequential
 from keras.layers import Dense
 import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataset import open_array, X_COLUMNS, Y_COLUMNS
 
 np.random.seed(4)
-trainData = np.loadtxt("../trainData.csv", delimiter=",")
+trainData = open_array("../trainData.csv")
 
-train_x = trainData[0:,0:23]
-train_y = trainData[0:,[24,25]]
+train_x = trainData[:, X_COLUMNS]
+train_y = trainData[:, Y_COLUMNS]
 
 # create model
 model = Sequential()
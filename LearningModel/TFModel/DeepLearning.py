@@ -3,18 +3,20 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataset import open_array, batches, X_COLUMNS, Y_COLUMNS
 
 os.environ['TF_CPP_MIN_LOG_LEVEL']='2'
 
 
-trainData = np.loadtxt('../trainData.csv', delimiter=',')
-testData = np.loadtxt('../testData.csv', delimiter=',')
+trainData = open_array('../trainData.csv')
+testData = open_array('../testData.csv')
 
 
-train_x = trainData[0:,0:23]
-train_y = trainData[0:,[24,25]]
-test_x = testData[0:,0:23]
-test_y = testData[0:,[24,25]]
+test_x = testData[:, X_COLUMNS]
+test_y = testData[:, Y_COLUMNS]
 
 nodes_hl1 = 4
 nodes_hl2 = 4
@@ -66,15 +68,9 @@ def train_NN(x):
         sess.run(tf.global_variables_initializer())
         for cycle in range(cycles):
             cycle_loss = 0
-            i = 0
-            while i < len(train_x):
-                start = i
-                end = batch_size+i
-                batch_x = np.array(train_x[start:end])
-                batch_y = np.array(train_y[start:end])
+            for batch_x, batch_y in batches(trainData, batch_size, seed=cycle, prefetch=4):
                 _, c = sess.run([optimize,cost], feed_dict={x: batch_x, y: batch_y})
                 cycle_loss += c
-                i += batch_size
 
             print ("Epoch", cycle+1, "completed out of" , cycles)
             loss.append(cycle_loss)
@@ -0,0 +1,182 @@
+"""
+Binary, memory-mapped access to the learning data.
+
+open_array accepts a CSV file (converted once to a .npy file next to it and
+reconverted only when the CSV is newer), a .npy file, or a shard directory
+written by generate.py. The rows are memory-mapped rather than read into
+memory.
+
+batches yields (x, y) mini-batches. With shuffle='batches' (the default)
+the order of contiguous blocks is shuffled and every batch is a view into the
+mapped file, so nothing is copied. shuffle='rows' draws a full permutation
+and gathers rows, which copies. With prefetch > 0 a background thread
+materializes upcoming batches while the caller trains on the current one.
+
+    data = open_array('../trainData.csv')
+    for batch_x, batch_y in batches(data, 50, prefetch=4):
+        ...
+"""
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+# Columns used by the learning scripts: the first 23 samples and the two targets
+X_COLUMNS = slice(0, 23)
+Y_COLUMNS = slice(24, 26)
+
+
+def convert_csv(csv_path, npy_path=None):
+    ''' Parse a CSV file once and store it as a .npy file. '''
+    if npy_path is None:
+        npy_path = os.path.splitext(csv_path)[0] + '.npy'
+    data = np.loadtxt(csv_path, delimiter=',', ndmin=2)
+    tmp = npy_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, data)
+    os.replace(tmp, npy_path)
+    return npy_path
+
+
+class ShardedArray:
+    ''' Read-only, row-indexed view over the shards listed in a shard directory's index. '''
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'index.json')) as f:
+            index = json.load(f)
+        self.shards = [np.load(os.path.join(directory, shard['file']), mmap_mode='r')
+                       for shard in index['shards']]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+        self.shape = (int(self.offsets[-1]), index['columns'])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def blocks(self, size):
+        ''' Yield (shard, start) for every block of up to size rows which lies within one shard. '''
+        for shard in self.shards:
+            for start in range(0, len(shard), size):
+                yield shard, start
+
+    def take(self, rows):
+        rows = np.asarray(rows)
+        out = np.empty((len(rows), self.shape[1]))
+        which = np.searchsorted(self.offsets, rows, side='right') - 1
+        for i, shard in enumerate(self.shards):
+            mask = which == i
+            if mask.any():
+                out[mask] = shard[rows[mask] - self.offsets[i]]
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, cols = key[0], key[1:]
+            return self[rows][(slice(None),) + cols]
+        if isinstance(key, slice):
+            return self.take(np.arange(*key.indices(len(self))))
+        if np.isscalar(key):
+            return self.take([key])[0]
+        return self.take(key)
+
+
+def open_array(path):
+    ''' Memory-map a CSV, .npy file or shard directory. '''
+    if os.path.isdir(path):
+        return ShardedArray(path)
+    if path.endswith('.csv'):
+        npy_path = os.path.splitext(path)[0] + '.npy'
+        if not os.path.exists(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(path):
+            convert_csv(path, npy_path)
+        path = npy_path
+    return np.load(path, mmap_mode='r')
+
+
+def _blocks(data, size):
+    if isinstance(data, ShardedArray):
+        return list(data.blocks(size))
+    return [(data, start) for start in range(0, len(data), size)]
+
+
+def _batches(data, batch_size, x, y, shuffle, rng, drop_last):
+    if shuffle == 'rows':
+        order = rng.permutation(len(data))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            if drop_last and len(rows) < batch_size:
+                break
+            block = data[np.sort(rows)] if isinstance(data, ShardedArray) else data[rows]
+            yield block[:, x], block[:, y]
+        return
+
+    blocks = _blocks(data, batch_size)
+    if shuffle:
+        blocks = [blocks[i] for i in rng.permutation(len(blocks))]
+    for array, start in blocks:
+        block = array[start:start + batch_size]
+        if drop_last and len(block) < batch_size:
+            continue
+        yield block[:, x], block[:, y]
+
+
+def _prefetch(iterator, depth):
+    ''' Run iterator in a background thread, keeping up to depth items ready. '''
+    done = object()
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up once the consumer has stopped, rather than blocking forever
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for batch_x, batch_y in iterator:
+                if not put((np.ascontiguousarray(batch_x), np.ascontiguousarray(batch_y))):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        put(done)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def batches(data, batch_size, x=X_COLUMNS, y=Y_COLUMNS, shuffle='batches', seed=None,
+            prefetch=0, drop_last=False):
+    '''
+    Iterate over (x, y) mini-batches of data.
+
+    Args:
+        data: An array or ShardedArray, usually from open_array.
+        batch_size: Rows per batch.
+        x, y: Column selections for the inputs and targets.
+        shuffle: 'batches' to shuffle the order of contiguous blocks (zero-copy),
+                 'rows' to shuffle individual rows (copies), or False.
+        seed: Seed for the shuffle.
+        prefetch: Number of batches to prepare ahead in a background thread.
+        drop_last: Skip batches smaller than batch_size.
+    '''
+    rng = np.random.RandomState(seed)
+    iterator = _batches(data, batch_size, x, y, shuffle, rng, drop_last)
+    if prefetch:
+        iterator = _prefetch(iterator, prefetch)
+    return iterator
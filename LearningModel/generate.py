@@ -0,0 +1,158 @@
+"""
+Generate training data for the learning models by running the agent model.
+
+Each row has the same layout as trainData.csv: WINDOW oxygen samples, WINDOW
+carbon dioxide samples and two targets, the number of humans and plants still
+alive after HORIZON steps (see ABM/surrogate.py). Rows are written to a
+directory of .npy shards:
+
+    data/
+        index.json          {"columns": 26, "dtype": "<f8", "shards": [{"file": ..., "rows": ...}, ...]}
+        shard_00000.npy
+        shard_00001.npy
+        ...
+
+Running the script again with the same directory appends new shards.
+--window and --horizon change the number of samples and the step of the
+targets, for surrogates which warm up for fewer steps or look further ahead.
+
+    python3 generate.py data 1000000 --processes 8
+    python3 generate.py data_w6 100000 --window 6 --horizon 400
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AgentModel'))
+
+from ABM.log import OFF
+from ABM.model import SingleRoomModel
+from ABM.surrogate import WINDOW, HORIZON, features, outcomes
+
+COLUMNS = 2*WINDOW + 2
+
+# Parameter ranges, matching the sliders in ABM/server.py
+PARAM_RANGES = dict(h_agents=(1, 10), p_agents=(0, 100), solar=(0, 400),
+                    excess_amount=(1, 100), plants_spread=(1, 50))
+PARAM_FLAGS = ('scrubber', 'regrowth', 'excess_co2')
+
+
+def sample_params(rng):
+    params = {name: rng.randint(low, high) for name, (low, high) in PARAM_RANGES.items()}
+    for name in PARAM_FLAGS:
+        params[name] = rng.random() < 0.5
+    return params
+
+
+def sample_row(series, window=WINDOW):
+    ''' Build one data row from the series returned by SingleRoomModel.run_model. '''
+    return np.hstack([features(series, window)[0], outcomes(series)[0]])
+
+
+def generate_rows(seed, rows, window=WINDOW, horizon=HORIZON):
+    ''' Run `rows` models with random parameters drawn from seed. '''
+    rng = random.Random(seed)
+    data = np.empty((rows, 2*window + 2))
+    for i in range(rows):
+        model = SingleRoomModel(log_level=OFF, seed=rng.randrange(2**32), **sample_params(rng))
+        data[i] = sample_row(model.run_model(horizon), window)
+    return data
+
+
+def _generate_task(task):
+    return generate_rows(*task)
+
+
+class ShardWriter:
+    '''
+    Appends rows to a directory of fixed size .npy shards.
+
+    Rows are buffered until a shard is full; the index is rewritten atomically
+    after every shard so readers only ever see complete shards.
+    '''
+
+    def __init__(self, directory, shard_rows=100000, columns=COLUMNS):
+        self.directory = directory
+        self.shard_rows = shard_rows
+        self.columns = columns
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+            if self.index['columns'] != columns:
+                raise ValueError('{} holds rows of {} columns, not {}'.format(
+                    directory, self.index['columns'], columns))
+        else:
+            self.index = {'columns': columns, 'dtype': '<f8', 'shards': []}
+        self.buffer = np.empty((shard_rows, columns))
+        self.count = 0
+
+    @property
+    def rows(self):
+        return sum(shard['rows'] for shard in self.index['shards']) + self.count
+
+    def append(self, rows):
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.columns)
+        while len(rows):
+            n = min(len(rows), self.shard_rows - self.count)
+            self.buffer[self.count:self.count + n] = rows[:n]
+            self.count += n
+            rows = rows[n:]
+            if self.count == self.shard_rows:
+                self.flush()
+
+    def flush(self):
+        if not self.count:
+            return
+        name = 'shard_{:05d}.npy'.format(len(self.index['shards']))
+        np.save(os.path.join(self.directory, name), self.buffer[:self.count])
+        self.index['shards'].append({'file': name, 'rows': self.count})
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, self.index_path)
+        self.count = 0
+
+    def close(self):
+        self.flush()
+
+
+def generate(directory, rows, processes=None, chunk=50, seed=None, shard_rows=100000,
+             window=WINDOW, horizon=HORIZON):
+    '''
+    Append `rows` generated rows to the shard directory, spreading the model
+    runs over a process pool. Finished chunks are written as they arrive, so
+    memory use does not grow with the number of rows.
+    '''
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    tasks = [(seed + i, min(chunk, rows - start), window, horizon)
+             for i, start in enumerate(range(0, rows, chunk))]
+    writer = ShardWriter(directory, shard_rows, 2*window + 2)
+    with multiprocessing.Pool(processes) as pool:
+        for data in pool.imap_unordered(_generate_task, tasks):
+            writer.append(data)
+    writer.close()
+    return writer.rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate training data shards from the agent model.')
+    parser.add_argument('directory')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunk', type=int, default=50, help='rows per worker task')
+    parser.add_argument('--shard-rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--window', type=int, default=WINDOW, help='oxygen and carbon samples per row')
+    parser.add_argument('--horizon', type=int, default=HORIZON, help='step of the targets')
+    args = parser.parse_args()
+    total = generate(args.directory, args.rows, args.processes, args.chunk, args.seed, args.shard_rows,
+                     args.window, args.horizon)
+    print('{} now holds {} rows'.format(args.directory, total))
@@ -0,0 +1,337 @@
+"""
+Hyperparameter search for the networks of KerasModel/KerasLearning.py
+(--model keras, the default) and TFModel/DeepLearning.py (--model tf).
+
+Every configuration in the model's search space (hidden layer sizes,
+optimizer, learning rate, batch size and, for Keras, the output activation)
+is scored by k-fold cross-validation: the mean validation loss over the
+folds, with each script's own loss (mean squared error for KerasLearning.py,
+softmax cross entropy of the logits for DeepLearning.py). Trials are pruned by successive halving:
+all configurations train for the first rung's epochs, the best 1/eta of them
+go on to the next rung's epochs, and so on, so losing configurations stop
+early and most of the time goes to the promising ones. Every trial retrains
+from scratch for its rung's epoch count.
+
+Each (configuration, fold) is one task in a process pool. The dataset is
+copied once into a shared memory block which every worker maps, so workers
+read the same rows instead of each receiving a copy (before Python 3.8, which
+has no multiprocessing.shared_memory, the block is a temporary memory-mapped
+file).
+
+Runs with the pinned Keras 2.0.x (optimizers take lr) as well as later
+versions (learning_rate), and with the pinned TensorFlow 1.x as well as
+TensorFlow 2 (through its compat.v1 graph API).
+
+The ranked results are written as a CSV table, best first.
+
+    python3 search.py                                   # grid over SEARCH_SPACE
+    python3 search.py --samples 40 --processes 8        # 40 random configurations
+    python3 search.py --folds 3 --rungs 3 9 27 --out results.csv
+    python3 search.py --model tf                        # DeepLearning.py network
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import inspect
+import random
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+from dataset import open_array, X_COLUMNS, Y_COLUMNS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SEARCH_SPACE = dict(layers=[(4, 4), (10, 10), (32, 16), (64, 32, 16)],
+                    activation=['sigmoid', 'linear'],
+                    optimizer=['adam', 'rmsprop', 'sgd'],
+                    learning_rate=[0.001, 0.01],
+                    batch_size=[20, 40, 100])
+
+OPTIMIZERS = {'adam': 'Adam', 'rmsprop': 'RMSprop', 'sgd': 'SGD'}
+
+# DeepLearning.py trains its 4-4 network with Ftrl at a learning rate of 0.001
+# in batches of 50
+TF_SEARCH_SPACE = dict(layers=[(4, 4), (10, 10), (32, 16), (64, 32, 16)],
+                       optimizer=['ftrl', 'adam', 'rmsprop', 'sgd'],
+                       learning_rate=[0.001, 0.01, 0.1],
+                       batch_size=[20, 50, 100])
+
+TF_OPTIMIZERS = {'ftrl': 'FtrlOptimizer', 'adam': 'AdamOptimizer',
+                 'rmsprop': 'RMSPropOptimizer', 'sgd': 'GradientDescentOptimizer'}
+
+# Epochs of each successive halving rung, and the fraction 1/ETA kept per rung
+RUNGS = (5, 15, 45)
+ETA = 3
+
+RESULT_FIELDS = ('rank', 'layers', 'activation', 'optimizer', 'learning_rate', 'batch_size',
+                 'epochs', 'val_loss', 'val_loss_std', 'folds', 'seconds')
+
+
+def configurations(space=SEARCH_SPACE, samples=None, seed=None):
+    ''' Every combination of the space, or samples distinct random ones. '''
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if samples is not None and samples < len(grid):
+        grid = random.Random(seed).sample(grid, samples)
+    return grid
+
+
+def kfold(rows, folds, seed=None):
+    ''' (train, validation) row indices of each fold of a shuffled split. '''
+    order = np.random.RandomState(seed).permutation(rows)
+    parts = np.array_split(order, folds)
+    return [(np.sort(np.concatenate(parts[:i] + parts[i + 1:])), np.sort(parts[i]))
+            for i in range(folds)]
+
+
+def fit_and_score(config, train_x, train_y, val_x, val_y, epochs, seed):
+    ''' Train the configuration's network and return its validation loss. '''
+    import keras
+    from keras.models import Sequential
+    from keras.layers import Dense
+
+    if hasattr(keras.utils, 'set_random_seed'):
+        keras.utils.set_random_seed(seed)
+    else:
+        np.random.seed(seed)
+
+    model = Sequential()
+    for i, units in enumerate(config['layers']):
+        if i == 0:
+            model.add(Dense(units, input_dim=train_x.shape[1], activation='relu'))
+        else:
+            model.add(Dense(units, activation='relu'))
+    model.add(Dense(train_y.shape[1], activation=config['activation']))
+    optimizer_class = getattr(keras.optimizers, OPTIMIZERS[config['optimizer']])
+    # Keras before 2.3 names the learning rate lr
+    rate = 'learning_rate' if 'learning_rate' in inspect.signature(optimizer_class).parameters else 'lr'
+    optimizer = optimizer_class(**{rate: config['learning_rate']})
+    model.compile(loss='mean_squared_error', optimizer=optimizer)
+    model.fit(train_x, train_y, epochs=epochs, batch_size=config['batch_size'], verbose=0)
+    return float(model.evaluate(val_x, val_y, verbose=0))
+
+
+def fit_and_score_tf(config, train_x, train_y, val_x, val_y, epochs, seed):
+    ''' Train the configuration's DeepLearning.py network and return its validation loss. '''
+    import tensorflow
+    # TensorFlow 2 keeps the graph API of the pinned 1.x under compat.v1
+    tf = getattr(getattr(tensorflow, 'compat', None), 'v1', tensorflow)
+    if hasattr(tf, 'disable_eager_execution'):
+        tf.disable_eager_execution()
+
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.set_random_seed(seed)
+        x = tf.placeholder(tf.float32, [None, train_x.shape[1]])
+        y = tf.placeholder(tf.float32, [None, train_y.shape[1]])
+        layer = x
+        sizes = list(config['layers']) + [train_y.shape[1]]
+        for i, units in enumerate(sizes):
+            weights = tf.Variable(tf.random_normal([int(layer.shape[1]), units]))
+            bias = tf.Variable(tf.random_normal([units]))
+            layer = tf.add(tf.matmul(layer, weights), bias)
+            if i < len(sizes) - 1:
+                layer = tf.nn.relu(layer)
+        cost = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits=layer, labels=y))
+        optimizer_class = getattr(tf.train, TF_OPTIMIZERS[config['optimizer']])
+        optimize = optimizer_class(learning_rate=config['learning_rate']).minimize(cost)
+        init = tf.global_variables_initializer()
+
+    rng = np.random.RandomState(seed)
+    batch_size = config['batch_size']
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
+    with tf.Session(graph=graph, config=session_config) as sess:
+        sess.run(init)
+        for _ in range(epochs):
+            order = rng.permutation(len(train_x))
+            for start in range(0, len(order), batch_size):
+                rows = order[start:start + batch_size]
+                sess.run(optimize, feed_dict={x: train_x[rows], y: train_y[rows]})
+        return float(sess.run(cost, feed_dict={x: val_x, y: val_y}))
+
+
+# Scorer and search space of each --model
+MODELS = {'keras': (fit_and_score, SEARCH_SPACE),
+          'tf': (fit_and_score_tf, TF_SEARCH_SPACE)}
+
+
+# Shared dataset
+
+_shared = None  # Shared memory block mapped by this worker
+_x = None
+_y = None
+_splits = None
+
+
+def _share(x, y):
+    '''
+    Copy x and y into one new shared block; returns a function which frees
+    it and the layout workers map it with (see _attach).
+    '''
+    x = np.asarray(x, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    size = max(x.nbytes + y.nbytes, 1)
+    if shared_memory is not None:
+        block = shared_memory.SharedMemory(create=True, size=size)
+        layout = ('shm', block.name, x.shape, y.shape)
+        buffer = block.buf
+
+        def release():
+            block.close()
+            block.unlink()
+    else:
+        fd, path = tempfile.mkstemp(suffix='.f32')
+        os.close(fd)
+        buffer = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+        layout = ('file', path, x.shape, y.shape)
+
+        def release():
+            os.remove(path)
+
+    shared_x, shared_y = _map(buffer, layout)
+    shared_x[:] = x
+    shared_y[:] = y
+    if shared_memory is None:
+        buffer.flush()
+    return release, layout
+
+
+def _attach(layout):
+    ''' Map a block made by _share: returns the object keeping it mapped, x and y. '''
+    kind, name, x_shape, y_shape = layout
+    if kind == 'shm':
+        block = shared_memory.SharedMemory(name=name)
+        return (block,) + _map(block.buf, layout)
+    size = 4*(int(np.prod(x_shape)) + int(np.prod(y_shape)))
+    block = np.memmap(name, dtype=np.uint8, mode='r', shape=(max(size, 1),))
+    return (block,) + _map(block, layout)
+
+
+def _map(buffer, layout):
+    _, _, x_shape, y_shape = layout
+    x = np.ndarray(x_shape, dtype=np.float32, buffer=buffer)
+    y = np.ndarray(y_shape, dtype=np.float32, buffer=buffer, offset=x.nbytes)
+    return x, y
+
+
+def _init_worker(layout, folds, seed):
+    global _shared, _x, _y, _splits
+    # One thread per worker: the pool already keeps every core busy
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', '1')
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    _shared, _x, _y = _attach(layout)
+    _splits = kfold(len(_x), folds, seed)
+
+
+def _run_trial(task):
+    ''' Score one configuration on one fold: returns (trial, fold, loss, seconds). '''
+    trial, fold, config, epochs, seed, model = task
+    train, val = _splits[fold]
+    scorer, _ = MODELS[model]
+    start = time.perf_counter()
+    loss = scorer(config, _x[train], _y[train], _x[val], _y[val], epochs, seed)
+    return trial, fold, loss, time.perf_counter() - start
+
+
+def search(data_path=os.path.join(HERE, 'trainData.csv'), configs=None, folds=5,
+           rungs=RUNGS, eta=ETA, processes=None, seed=0, out=None, progress=print,
+           model='keras'):
+    '''
+    Successive halving search with k-fold cross-validation.
+
+    Args:
+        data_path: Anything open_array reads (CSV, .npy or shard directory).
+        configs: List of configuration dicts (default: every configuration
+                 of the model's search space).
+        folds: Number of cross-validation folds.
+        rungs: Increasing epoch counts; after each rung the best 1/eta of
+               the trials are kept.
+        processes: Worker processes (default: one per core).
+        seed: Seed of the fold split and of every trial's initial weights.
+        out: Path of the CSV table to write, or None.
+        progress: Called with a line of text after every rung.
+        model: 'keras' (KerasLearning.py) or 'tf' (DeepLearning.py).
+
+    Returns:
+        A list with one dict per configuration (see RESULT_FIELDS), best first.
+    '''
+    configs = configurations(MODELS[model][1]) if configs is None else configs
+    data = open_array(data_path)
+    results = [dict(config, epochs=0, val_loss=np.inf, val_loss_std=0.0, folds=0, seconds=0.0)
+               for config in configs]
+
+    release, layout = _share(data[:, X_COLUMNS], data[:, Y_COLUMNS])
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_worker,
+                                  initargs=(layout, folds, seed)) as pool:
+            alive = list(range(len(configs)))
+            for rung, epochs in enumerate(rungs):
+                tasks = [(trial, fold, configs[trial], epochs, seed + fold, model)
+                         for trial in alive for fold in range(folds)]
+                losses = {trial: [] for trial in alive}
+                for trial, fold, loss, seconds in pool.imap_unordered(_run_trial, tasks):
+                    losses[trial].append(loss)
+                    results[trial]['seconds'] += seconds
+                for trial in alive:
+                    loss = float(np.mean(losses[trial]))
+                    # A diverged trial (nan loss) ranks last instead of breaking the sort
+                    results[trial].update(epochs=epochs, val_loss=loss if np.isfinite(loss) else np.inf,
+                                          val_loss_std=float(np.std(losses[trial])), folds=folds)
+
+                alive.sort(key=lambda trial: results[trial]['val_loss'])
+                best = results[alive[0]]
+                progress('rung {} ({} epochs): {} trials, best val_loss {:.4g}'.format(
+                    rung + 1, epochs, len(alive), best['val_loss']))
+                alive = alive[:max(len(alive) // eta, 1)]
+    finally:
+        release()
+
+    # Trials which got further rank first, then by their loss at that rung
+    ranked = sorted(results, key=lambda result: (-result['epochs'], result['val_loss']))
+    for rank, result in enumerate(ranked, 1):
+        result['rank'] = rank
+    if out is not None:
+        write_results(ranked, out)
+    return ranked
+
+
+def write_results(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, RESULT_FIELDS, restval='', extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            writer.writerow(dict(result, layers='-'.join(map(str, result['layers']))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search hyperparameters of the Keras or TensorFlow model.')
+    parser.add_argument('--model', choices=sorted(MODELS), default='keras')
+    parser.add_argument('--data', default=os.path.join(HERE, 'trainData.csv'))
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--rungs', type=int, nargs='+', default=list(RUNGS), help='epochs per rung')
+    parser.add_argument('--eta', type=int, default=ETA, help='keep the best 1/eta trials per rung')
+    parser.add_argument('--samples', type=int, default=None,
+                        help='random configurations to try (default: the whole grid)')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='search_results.csv')
+    args = parser.parse_args()
+    configs = configurations(MODELS[args.model][1], args.samples, args.seed)
+    ranked = search(args.data, configs, args.folds, args.rungs, args.eta, args.processes,
+                    args.seed, args.out, model=args.model)
+    for result in ranked[:10]:
+        print('{rank:>3} {layers!s:<14} {activation:<8} {optimizer:<8} {learning_rate:<6} '
+              '{batch_size:<4} {epochs:>3} epochs  val_loss {val_loss:.4g} +- {val_loss_std:.2g}'.format(
+                  **dict(dict(activation='-'), **result)))
+    print('Wrote', args.out)
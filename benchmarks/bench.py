@@ -0,0 +1,234 @@
+"""
+Benchmark suite for the models and the learning-data loaders.
+
+Every run measures the same workloads:
+
+    abm      SingleRoomModel over a matrix of h_agents, p_agents, grid size,
+             regrowth and step count: steps/sec, peak memory and the time
+             share of each phase (species turns, data collection, logging).
+             Models run strict, so every step is simulated even once the
+             run could be fast-forwarded
+    diff     DiffModel/engine.simulate over many scenarios: scenarios/sec
+    loaders  LearningModel/dataset.batches over .npy and shard data:
+             rows/sec for each shuffle mode
+
+Results are appended to history.jsonl (one JSON object per run) and compared
+against baseline.json; a case whose rate fell by more than the tolerance is
+reported as a regression and the script exits with status 1.
+
+    python3 benchmarks/bench.py                  # full suite
+    python3 benchmarks/bench.py --quick abm      # smaller matrix, one suite
+    python3 benchmarks/bench.py --save-baseline  # make this run the baseline
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('AgentModel', 'DiffModel', 'LearningModel'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HISTORY = os.path.join(HERE, 'history.jsonl')
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+ABM_MATRIX = dict(h_agents=[1, 5], p_agents=[10, 100], grid=[20, 50],
+                  regrowth=[False, True], steps=[100, 500])
+ABM_QUICK = dict(h_agents=[1, 5], p_agents=[10, 100], grid=[20],
+                 regrowth=[False], steps=[100])
+
+
+def _matrix(values):
+    names = sorted(values)
+    for combination in itertools.product(*(values[name] for name in names)):
+        yield dict(zip(names, combination))
+
+
+def _best_time(func, repeat):
+    ''' Best wall time of repeat calls, the usual estimate least disturbed by noise. '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(func):
+    ''' Peak Python memory allocated while func runs, in bytes. '''
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Workloads
+
+
+def bench_abm(quick=False, repeat=3):
+    from ABM.batch import DEFAULTS
+    from ABM.log import OFF
+    from ABM.model import SingleRoomModel
+    from ABM.profiling import Profiler
+
+    results = []
+    for case in _matrix(ABM_QUICK if quick else ABM_MATRIX):
+        params = dict(DEFAULTS, h_agents=case['h_agents'], p_agents=case['p_agents'],
+                      regrowth=case['regrowth'], width=case['grid'], height=case['grid'],
+                      log_level=OFF, seed=0, strict=True)
+
+        def run():
+            SingleRoomModel(**params).run_model(case['steps'])
+
+        elapsed = _best_time(run, repeat)
+        peak = _peak_memory(run)
+
+        model = SingleRoomModel(**params)
+        with Profiler(model, calls=False) as profiler:
+            model.run_model(case['steps'])
+        phases = {row['name']: round(row['share'], 4) for row in profiler.span_table()}
+
+        results.append({'suite': 'abm', 'case': case, 'rate': case['steps']/elapsed,
+                        'unit': 'steps/s', 'seconds': elapsed, 'peak_bytes': peak,
+                        'phases': phases})
+    return results
+
+
+def bench_diff(quick=False, repeat=3):
+    import engine
+
+    results = []
+    for scenarios, days in ([(1000, 100)] if quick else [(1000, 100), (100000, 100), (10000, 1000)]):
+        rng = np.random.RandomState(0)
+        area = rng.uniform(0, 200, scenarios)
+        people = rng.randint(1, 10, scenarios)
+
+        def run():
+            engine.simulate(area, people, days=days)
+
+        elapsed = _best_time(run, repeat)
+        results.append({'suite': 'diff', 'case': {'scenarios': scenarios, 'days': days},
+                        'rate': scenarios/elapsed, 'unit': 'scenarios/s', 'seconds': elapsed,
+                        'peak_bytes': _peak_memory(run)})
+    return results
+
+
+def bench_loaders(quick=False, repeat=3):
+    import dataset
+    from generate import ShardWriter
+
+    rows = 20000 if quick else 200000
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        data = np.random.RandomState(0).rand(rows, 26)
+        npy_path = os.path.join(directory, 'data.npy')
+        np.save(npy_path, data)
+        writer = ShardWriter(os.path.join(directory, 'shards'), shard_rows=rows//4)
+        writer.append(data)
+        writer.close()
+
+        for source, path in (('npy', npy_path), ('shards', writer.directory)):
+            array = dataset.open_array(path)
+            for shuffle in ('batches', 'rows', False):
+                def run():
+                    for _ in dataset.batches(array, 50, shuffle=shuffle, seed=0):
+                        pass
+
+                elapsed = _best_time(run, repeat)
+                results.append({'suite': 'loaders',
+                                'case': {'source': source, 'shuffle': shuffle, 'rows': rows},
+                                'rate': rows/elapsed, 'unit': 'rows/s', 'seconds': elapsed})
+    return results
+
+
+SUITES = {'abm': bench_abm, 'diff': bench_diff, 'loaders': bench_loaders}
+
+
+# History and baseline
+
+
+def case_key(result):
+    return result['suite'] + ' ' + json.dumps(result['case'], sort_keys=True)
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, tolerance=0.15):
+    ''' Return (key, baseline rate, rate, change) for every case slower than the baseline by more than tolerance. '''
+    previous = {case_key(result): result['rate'] for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before and result['rate'] < before*(1 - tolerance):
+            regressions.append((case_key(result), before, result['rate'], result['rate']/before - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the benchmark suite.')
+    parser.add_argument('suites', nargs='*', help='any of {} (default: all)'.format(', '.join(sorted(SUITES))))
+    parser.add_argument('--quick', action='store_true', help='smaller workloads')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case, the best counts')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args(argv)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error('unknown suites: ' + ', '.join(sorted(unknown)))
+
+    run = environment()
+    run['quick'] = args.quick
+    run['results'] = []
+    for name in args.suites or sorted(SUITES):
+        for result in SUITES[name](args.quick, args.repeat):
+            print('{:<70} {:>14,.0f} {}'.format(case_key(result), result['rate'], result['unit']))
+            run['results'].append(result)
+
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=1)
+        print('Saved baseline to', args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at {}; run with --save-baseline to create one'.format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(run['results'], baseline, args.tolerance)
+    for key, before, after, change in regressions:
+        print('REGRESSION {}: {:,.0f} -> {:,.0f} ({:+.1%})'.format(key, before, after, change))
+    if not regressions:
+        print('No regressions against baseline from {} ({})'.format(baseline['time'], baseline['commit']))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,15 +4,14 @@ def main():
     os.system('pip3 install -r requirements.txt')
     import mesa
     path = os.path.join(mesa.__file__[:-12],"visualization")
-    paths = [os.path.join(path,'templates','css'),
-             os.path.join(path,'templates','js'),
-             os.path.join(path,'templates','js'),
-             os.path.join(path,'templates'),
-             path]
+    paths = {'additional.css': os.path.join(path,'templates','css'),
+             'additional.js': os.path.join(path,'templates','js'),
+             'ChartModule.js': os.path.join(path,'templates','js'),
+             'runcontrol.js': os.path.join(path,'templates','js'),
+             'modular_template.html': os.path.join(path,'templates'),
+             'ModularVisualization.py': path}
 
-    src_files = os.listdir('updates')
-
-    for src,dest in zip(src_files,paths):
+    for src,dest in sorted(paths.items()):
         print ('Copying ' + src + '...')
         shutil.copy(os.path.join('updates',src), dest)
     print ('Finished.')
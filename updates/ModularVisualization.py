@@ -24,8 +24,11 @@ PageHandler: The handler for the visualization page, generated from a template
              and built from the various visualization elements.
 SocketHandler: Handles the websocket connection between the client page and
                 the server.
+Session: One model instance with its parameters, driven by one or more
+         connections.
+SessionPool: Hosts the sessions, in the server process or in worker processes.
 ModularServer: The overall visualization application class which stores and
-               controls the model and visualization instance.
+               controls the sessions and visualization elements.
 
 
 ModularServer should *not* need to be subclassed on a model-by-model basis; it
@@ -38,6 +41,21 @@ called canvasvis and graphvis; we would launch a server with:
     server = ModularServer(MyModel, [canvasvis, graphvis], name="My Model")
     server.launch()
 
+Every websocket connection gets its own model instance, so several browser
+tabs can run independent simulations. A tab opened on /?session=<name>
+(passed on to the websocket as /ws?session=<name>) joins a named session
+instead, which survives reconnects until it has been idle for
+session_timeout seconds. With launch(processes=N) the models run in N worker
+processes and each session is pinned to one of them.
+
+With record_dir set, every session records the rendered state of each step
+to a RunFile in that directory, and get_step requests for steps that were
+already run are served from it, so the client can scrub back and forth
+without simulating again. A recording is played back without any model by
+passing its path as replay (model_cls may then be None):
+
+    server = ModularServer(None, [canvasvis, graphvis], replay="runs/<name>")
+
 The client keeps track of what step it is showing. Clicking the Step button in
 the browser sends a message requesting the viz_state corresponding to the next
 step position, which is then sent back to the client via the websocket.
@@ -61,10 +79,22 @@ Server -> Client:
             "Shape Count: 1"]
     }
 
+    Binary frames (after "set_protocol" with "binary"): the same state, sent
+    as delta frames which only contain the grid cells and chart points that
+    changed since the previous frame. See FrameEncoder for the layout.
+
+    A recorded state, sent in reply to get_step for a step that was already
+    run (always JSON, whatever the protocol).
+    {"type": "viz_state", "data": [...], "step": step the state belongs to}
+
     Informs the client that the model is over.
     {"type": "end"}
 
-    Informs the client of the current model's parameters
+    The step the session is at, sent in reply to "pause".
+    {"type": "position", "step": number of steps since the reset}
+
+    Informs the client of the current model's parameters, with the values
+    this session resets to (sent in reply to "get_params")
     {
     "type": "model_params",
     "params": 'dict' of model params, (i.e. {arg_1: val_1, ...})
@@ -77,7 +107,9 @@ Client -> Server:
     "type": "reset"
     }
 
-    Get a given state.
+    Get a given state: a step which was already run is served from the
+    recording, a later one is simulated up to. Without a recording or a
+    "step" the model advances one step.
     {
     "type": "get_step",
     "step:" index of the step to get.
@@ -95,8 +127,57 @@ Client -> Server:
     "type": "get_params"
     }
 
+    Switch this connection between JSON viz_state messages ("json", the
+    default) and binary delta frames ("binary").
+    {
+    "type": "set_protocol",
+    "protocol": "binary"
+    }
+
+    Acknowledge that a frame was applied. In play mode every ack returns one
+    credit to the server; JSON clients leave out "seq".
+    {
+    "type": "ack",
+    "seq": sequence number of the frame
+    }
+
+    Let the server run the model on its own, pushing a frame every
+    steps_per_frame steps at up to fps frames per second. At most window
+    frames are sent without being acknowledged; while the client is out of
+    credit the server keeps stepping (up to max_lag steps past the last frame
+    it sent) and the skipped states are merged into the next frame.
+    {
+    "type": "play",
+    "fps": 30, "steps_per_frame": 1, "window": 2, "max_lag": 30
+    }
+
+    Stop play mode.
+    {
+    "type": "pause"
+    }
+
+    Run the given number of steps without rendering, then send one frame.
+    {
+    "type": "run_steps",
+    "steps": 10000
+    }
+
+    Ask for a keyframe, e.g. after receiving a frame whose base is not the
+    last frame the client applied.
+    {
+    "type": "resync"
+    }
+
 """
+import collections
+import concurrent.futures
+import json
+import mmap
 import os
+import struct
+import threading
+import time
+import uuid
 import tornado.autoreload
 import tornado.ioloop
 import tornado.web
@@ -104,6 +185,9 @@ import tornado.websocket
 import tornado.escape
 import tornado.gen
 import webbrowser
+import zlib
+
+import numpy as np
 
 from mesa.visualization.UserParam import UserSettableParameter
 import multiprocessing
@@ -149,6 +233,568 @@ class VisualizationElement:
         """
         return "<b>VisualizationElement goes here</b>."
 
+
+# =============================================================================
+# Binary frame protocol:
+
+
+class FrameEncoder:
+    """ Encodes visualization state as compact binary delta frames.
+
+    One encoder serves one websocket connection. Every frame carries its own
+    sequence number and the sequence number of the frame it is a delta
+    against; a keyframe (flag bit 0) replaces the client's state entirely.
+    All integers are little endian.
+
+        frame   := "MF" u8 version u8 flags u32 seq u32 base u16 n_elements element*
+        element := u8 kind payload
+        grid    (kind 0): u16 n_styles (u16 id, u32 len, utf-8 JSON portrayal)*
+                          u32 n_cells (u16 x, u16 y, u8 n, u16 style_id * n)*
+        chart   (kind 1): u32 n_rows u16 n_series f64 * (n_rows * n_series)
+        json    (kind 2): u32 len, utf-8 JSON render output (len 0: unchanged)
+
+    Grid cells are only sent when their portrayals changed since the previous
+    frame (n = 0 clears a cell), and each distinct portrayal is sent once per
+    connection and referred to by id afterwards. Chart elements send the rows
+    appended to their data collector since the previous frame.
+    """
+    VERSION = 1
+    GRID, CHART, JSON = 0, 1, 2
+
+    def __init__(self, visualization_elements):
+        self.elements = visualization_elements
+        self.seq = 0
+        self.acked = 0
+        self.reset()
+
+    def reset(self):
+        """ Forget what the client holds; the next frame is a keyframe. """
+        self.styles = {}
+        self.cells = [None] * len(self.elements)
+        self.chart_rows = [0] * len(self.elements)
+        self.json = [None] * len(self.elements)
+        self.need_keyframe = True
+
+    def kind(self, element):
+        if hasattr(element, 'portrayal_method') and hasattr(element, 'grid_width'):
+            return self.GRID
+        if hasattr(element, 'series') and hasattr(element, 'data_collector_name'):
+            return self.CHART
+        return self.JSON
+
+    def encode(self, model, render_state, keyframe=False):
+        """ Encode render_state, the output of ModularServer.render_model(). """
+        if keyframe or self.need_keyframe:
+            self.reset()
+            keyframe = True
+        self.need_keyframe = False
+        base = self.seq
+        self.seq += 1
+        parts = [struct.pack('<2sBBIIH', b'MF', self.VERSION, int(keyframe),
+                             self.seq, base, len(self.elements))]
+        for i, (element, state) in enumerate(zip(self.elements, render_state)):
+            kind = self.kind(element)
+            parts.append(struct.pack('<B', kind))
+            if kind == self.GRID:
+                parts.append(self._encode_grid(i, state))
+            elif kind == self.CHART:
+                parts.append(self._encode_chart(i, element, model, state))
+            else:
+                parts.append(self._encode_json(i, state))
+        return b''.join(parts)
+
+    def _style(self, portrayal, new_styles):
+        key = json.dumps({k: v for k, v in portrayal.items() if k not in ('x', 'y')},
+                         sort_keys=True)
+        style = self.styles.get(key)
+        if style is None:
+            style = len(self.styles)
+            self.styles[key] = style
+            new_styles.append((style, key.encode()))
+        return style
+
+    def _encode_grid(self, i, state):
+        new_styles = []
+        cells = {}
+        for layer in state.values():
+            for portrayal in layer:
+                pos = (portrayal['x'], portrayal['y'])
+                cells.setdefault(pos, []).append(self._style(portrayal, new_styles))
+        cells = {pos: tuple(ids) for pos, ids in cells.items()}
+        previous = self.cells[i] or {}
+        changed = [(pos, ids) for pos, ids in cells.items() if previous.get(pos) != ids]
+        changed.extend((pos, ()) for pos in previous if pos not in cells)
+        self.cells[i] = cells
+
+        parts = [struct.pack('<H', len(new_styles))]
+        for style, text in new_styles:
+            parts.append(struct.pack('<HI', style, len(text)))
+            parts.append(text)
+        parts.append(struct.pack('<I', len(changed)))
+        for (x, y), ids in changed:
+            parts.append(struct.pack('<HHB{}H'.format(len(ids)), x, y, len(ids), *ids))
+        return b''.join(parts)
+
+    def _encode_chart(self, i, element, model, state):
+        labels = [s['Label'] for s in element.series]
+        collector = getattr(model, element.data_collector_name, None)
+        if hasattr(collector, 'since'):
+            # Columnar collector (e.g. ABM.collect.SeriesCollector): slice the
+            # new rows directly; rows which left its ring buffer are skipped
+            table = collector.since(self.chart_rows[i])
+            self.chart_rows[i] = collector.rows
+            rows = table[:, [collector.columns[label] for label in labels]]
+            return (struct.pack('<IH', len(rows), len(labels)) +
+                    rows.astype('<f8').tobytes())
+        history = getattr(collector, 'model_vars', {})
+        columns = [history.get(label, []) for label in labels]
+        total = min(len(column) for column in columns) if columns else 0
+        start = min(self.chart_rows[i], total)
+        self.chart_rows[i] = total
+        rows = [[float(column[r]) for column in columns] for r in range(start, total)]
+        values = [v for row in rows for v in row]
+        return (struct.pack('<IH', len(rows), len(labels)) +
+                struct.pack('<{}d'.format(len(values)), *values))
+
+    def _encode_json(self, i, state):
+        text = json.dumps(state)
+        if text == self.json[i]:
+            return struct.pack('<I', 0)
+        self.json[i] = text
+        data = text.encode()
+        return struct.pack('<I', len(data)) + data
+
+
+# =============================================================================
+# Recorded runs:
+
+
+class RunFile:
+    """ Append-only file of rendered frames with random access by step.
+
+    A run is stored as two files:
+
+        <path>.frames   zlib compressed JSON render states, back to back
+        <path>.index    one INDEX_DTYPE record per frame: the step it shows,
+                        and its offset and length in <path>.frames
+
+    Both are memory-mapped for reading (and remapped as the run grows), so
+    frame(step) costs a binary search of the index and one decompression;
+    recently read frames are kept in an LRU cache of cache_size frames.
+    """
+    INDEX_DTYPE = np.dtype([('step', '<u4'), ('offset', '<u8'), ('length', '<u4')])
+
+    def __init__(self, path, mode='r', cache_size=256):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.index = np.zeros(0, dtype=self.INDEX_DTYPE)
+        self.data = b''
+        self.writer = None
+        if mode == 'w':
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.writer = (open(path + '.frames', 'wb'), open(path + '.index', 'wb'))
+            self.size = 0
+            self.count = 0
+        else:
+            self.count = os.path.getsize(path + '.index') // self.INDEX_DTYPE.itemsize
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def last_step(self):
+        """ Step shown by the last frame, or -1 if there is none. """
+        if not self.count:
+            return -1
+        self._map(self.count)
+        return int(self.index['step'][self.count - 1])
+
+    def append(self, step, render_state):
+        frames, index = self.writer
+        blob = zlib.compress(json.dumps(render_state).encode(), 1)
+        frames.write(blob)
+        frames.flush()
+        record = np.array([(step, self.size, len(blob))], dtype=self.INDEX_DTYPE)
+        index.write(record.tobytes())
+        index.flush()
+        self.size += len(blob)
+        self.count += 1
+
+    def _map(self, count):
+        """ Make sure the first count frames are mapped. """
+        if len(self.index) >= count:
+            return
+        self.count = max(self.count, os.path.getsize(self.path + '.index') // self.INDEX_DTYPE.itemsize)
+        self.index = np.memmap(self.path + '.index', dtype=self.INDEX_DTYPE, mode='r',
+                               shape=(self.count,))
+        with open(self.path + '.frames', 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def frame(self, step):
+        """ Return (step, render state) of the last frame at or before step. """
+        if not self.count:
+            raise IndexError("{} holds no frames".format(self.path))
+        self._map(self.count)
+        i = max(int(np.searchsorted(self.index['step'][:self.count], step, side='right')) - 1, 0)
+        cached = self.cache.get(i)
+        if cached is not None:
+            self.cache.move_to_end(i)
+            return cached
+        record = self.index[i]
+        start = int(record['offset'])
+        state = json.loads(zlib.decompress(self.data[start:start + int(record['length'])]).decode())
+        cached = (int(record['step']), state)
+        self.cache[i] = cached
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return cached
+
+    def close(self):
+        if self.writer is not None:
+            for f in self.writer:
+                f.close()
+            self.writer = None
+
+
+# =============================================================================
+# Sessions:
+
+
+class SessionLimitError(Exception):
+    """ Raised when a new session would exceed ModularServer.max_sessions. """
+
+
+class Session:
+    """ One model instance, its parameters and the connection's frame encoder.
+
+    Sessions live either in the server process or in a worker process; the
+    methods return the message to send to the client (a dict for JSON
+    messages, bytes for binary frames, or None).
+    """
+
+    def __init__(self, model_cls, visualization_elements, model_params, record_dir=None):
+        self.model_cls = model_cls
+        self.elements = visualization_elements
+        self.model_params = dict(model_params)
+        self.record_dir = record_dir
+        self.recording = None
+        self.encoder = None
+        self.model = None
+        self.steps = 0  # Steps run since the last reset
+        self.unrendered = 0  # Steps run since the last state was rendered
+
+    def render_model(self):
+        return [element.render(self.model) for element in self.elements]
+
+    def state(self, keyframe=False):
+        self.unrendered = 0
+        render_state = self._record(self.render_model())
+        if self.encoder is None:
+            return {"type": "viz_state", "data": render_state}
+        return self.encoder.encode(self.model, render_state, keyframe)
+
+    def _record(self, render_state):
+        if self.recording is not None and self.recording.last_step < self.steps:
+            self.recording.append(self.steps, render_state)
+        return render_state
+
+    def reset(self):
+        self.model = self.model_cls(**self.model_params)
+        self.steps = 0
+        if self.record_dir is not None:
+            if self.recording is not None:
+                self.recording.close()
+            name = "{}-{}".format(time.strftime("%Y%m%d-%H%M%S"), uuid.uuid4().hex[:8])
+            self.recording = RunFile(os.path.join(self.record_dir, name), 'w')
+        return self.state(keyframe=True)
+
+    def step(self):
+        return self.run(1)
+
+    def run(self, steps, render=True):
+        """ Run up to steps steps, stopping early if the model stops.
+
+        With render=False returns the number of steps run. Otherwise returns
+        the state, which includes any steps run without rendering before, or
+        an "end" message once the model has stopped and its final state was
+        sent.
+        """
+        count = 0
+        while count < steps and self.model.running:
+            self.model.step()
+            self.steps += 1
+            count += 1
+            if self.recording is not None and (count < steps or not render):
+                self._record(self.render_model())  # Every step goes into the recording
+        self.unrendered += count
+        if not render:
+            return count
+        if not self.unrendered and not self.model.running:
+            return {"type": "end"}
+        return self.state()
+
+    def get_step(self, step=None):
+        """ The state after the given step since the reset.
+
+        Steps which were already run are served from the recording; later
+        steps are simulated up to the requested one. Without a recording
+        (or a step) this steps the model once, as before.
+        """
+        if step is None or (self.recording is None and step <= self.steps):
+            return self.step()
+        if step > self.steps:
+            return self.run(step - self.steps)
+        shown, render_state = self.recording.frame(step)
+        if self.encoder is not None:
+            self.encoder.need_keyframe = True  # The client no longer shows the last frame
+        return {"type": "viz_state", "data": render_state, "step": shown}
+
+    def position(self):
+        return {"type": "position", "step": self.steps}
+
+    def resync(self):
+        return self.state(keyframe=True)
+
+    def set_protocol(self, protocol):
+        if protocol == "binary":
+            self.encoder = FrameEncoder(self.elements)
+        else:
+            self.encoder = None
+
+    def ack(self, seq):
+        if self.encoder is not None and seq is not None:
+            self.encoder.acked = seq
+
+    def set_param(self, param, value):
+        self.model_params[param] = value
+
+    def params(self):
+        """ The parameters of this session's next reset. """
+        return dict(self.model_params)
+
+
+class ReplaySession:
+    """ Plays back a recorded run (see RunFile) without a model instance.
+
+    It answers the same calls as Session; frames are always sent as JSON
+    viz_state messages and parameter changes have no effect.
+    """
+
+    def __init__(self, path):
+        self.recording = RunFile(path)
+        self.steps = 0
+        self.unrendered = 0  # Steps skipped by run(render=False) and not yet sent
+
+    def _frame(self, step):
+        shown, render_state = self.recording.frame(step)
+        self.steps = shown
+        self.unrendered = 0
+        return {"type": "viz_state", "data": render_state, "step": shown}
+
+    def reset(self):
+        return self._frame(0)
+
+    def step(self):
+        return self.run(1)
+
+    def run(self, steps, render=True):
+        """ Advance up to steps recorded steps, as Session.run does. """
+        target = min(self.steps + steps, self.recording.last_step)
+        count = target - self.steps
+        if not render:
+            self.steps = target
+            self.unrendered += count
+            return count
+        if not count and not self.unrendered:
+            return {"type": "end"}
+        return self._frame(target)
+
+    def get_step(self, step=None):
+        if step is None:
+            return self.step()
+        if step > self.recording.last_step:
+            return {"type": "end"}
+        return self._frame(step)
+
+    def position(self):
+        return {"type": "position", "step": self.steps}
+
+    def resync(self):
+        return self._frame(self.steps)
+
+    def set_protocol(self, protocol):
+        pass
+
+    def ack(self, seq):
+        pass
+
+    def set_param(self, param, value):
+        pass
+
+    def params(self):
+        return {}
+
+
+def make_session(model_cls, visualization_elements, model_params, record_dir=None, replay=None):
+    if replay is not None:
+        return ReplaySession(replay)
+    return Session(model_cls, visualization_elements, model_params, record_dir)
+
+
+def _session_worker(conn, model_cls, visualization_elements, record_dir=None, replay=None):
+    """ Main loop of a worker process: runs commands against its sessions. """
+    sessions = {}
+    while True:
+        try:
+            session_id, method, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            if method == "open":
+                sessions[session_id] = make_session(model_cls, visualization_elements, *args,
+                                                    record_dir=record_dir, replay=replay)
+                result = None
+            elif method == "close":
+                sessions.pop(session_id, None)
+                result = None
+            else:
+                result = getattr(sessions[session_id], method)(*args)
+        except Exception as e:
+            conn.send((False, repr(e)))
+        else:
+            conn.send((True, result))
+
+
+class SessionHandle:
+    """ Server-side bookkeeping for one session. """
+
+    def __init__(self, session_id, worker):
+        self.session_id = session_id
+        self.worker = worker  # Index into SessionPool.workers, or None if local
+        self.connections = 0
+        self.last_used = time.time()
+        # Runs the session's calls one at a time, in the order they were made
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+
+class SessionPool:
+    """ Hosts sessions in the server process or in a pool of worker processes.
+
+    With workers > 0 every session is assigned to the worker process holding
+    the fewest sessions when it is opened and stays there (sticky routing), so
+    the model never moves between processes. Calls never block the caller:
+    each returns a Future and runs on the session's own executor thread, so
+    the calls to one session run in order while the IOLoop keeps serving
+    other connections. At most max_sessions exist at
+    once; when the limit is reached the least recently used session without a
+    connection is evicted, and sessions idle for longer than timeout seconds
+    are evicted by evict_idle().
+    """
+
+    def __init__(self, model_cls, visualization_elements, workers=0,
+                 max_sessions=64, timeout=600, record_dir=None, replay=None):
+        self.model_cls = model_cls
+        self.elements = visualization_elements
+        self.record_dir = record_dir
+        self.replay = replay
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.handles = {}
+        self.local = {}
+        self.workers = []
+        for _ in range(workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_session_worker,
+                args=(child_conn, model_cls, visualization_elements, record_dir, replay),
+                daemon=True)
+            process.start()
+            self.workers.append({"conn": parent_conn, "process": process,
+                                 "lock": threading.Lock(), "sessions": 0})
+
+    def __len__(self):
+        return len(self.handles)
+
+    def open(self, session_id, model_params):
+        """ Return the handle for session_id, creating the session if needed. """
+        handle = self.handles.get(session_id)
+        if handle is None:
+            if len(self.handles) >= self.max_sessions:
+                self._evict_one()
+            worker = None
+            if self.workers:
+                worker = min(range(len(self.workers)),
+                             key=lambda i: self.workers[i]["sessions"])
+                self.workers[worker]["sessions"] += 1
+            handle = SessionHandle(session_id, worker)
+            self.handles[session_id] = handle
+            handle.executor.submit(self._send, handle, "open", model_params)
+        handle.connections += 1
+        handle.last_used = time.time()
+        return handle
+
+    def release(self, handle):
+        """ Drop a connection; the session stays open until closed or evicted. """
+        handle.connections -= 1
+
+    def close(self, handle):
+        if self.handles.pop(handle.session_id, None) is None:
+            return
+        if handle.worker is not None:
+            self.workers[handle.worker]["sessions"] -= 1
+        handle.executor.submit(self._send, handle, "close")
+        handle.executor.shutdown(wait=False)
+
+    def call(self, handle, method, *args):
+        """ Run method on the session; returns a concurrent.futures.Future. """
+        handle.last_used = time.time()
+        return handle.executor.submit(self._send, handle, method, *args)
+
+    def _send(self, handle, method, *args):
+        if handle.worker is None:
+            if method == "open":
+                self.local[handle.session_id] = make_session(
+                    self.model_cls, self.elements, *args,
+                    record_dir=self.record_dir, replay=self.replay)
+                return None
+            if method == "close":
+                self.local.pop(handle.session_id, None)
+                return None
+            return getattr(self.local[handle.session_id], method)(*args)
+
+        worker = self.workers[handle.worker]
+        with worker["lock"]:
+            worker["conn"].send((handle.session_id, method, args))
+            ok, result = worker["conn"].recv()
+        if not ok:
+            raise RuntimeError("Session {} failed: {}".format(handle.session_id, result))
+        return result
+
+    def _evict_one(self):
+        idle = [h for h in self.handles.values() if h.connections <= 0]
+        if not idle:
+            raise SessionLimitError("All {} sessions are in use".format(self.max_sessions))
+        self.close(min(idle, key=lambda h: h.last_used))
+
+    def evict_idle(self):
+        """ Close sessions without connections that have not been used for timeout seconds. """
+        cutoff = time.time() - self.timeout
+        for handle in list(self.handles.values()):
+            if handle.connections <= 0 and handle.last_used < cutoff:
+                self.close(handle)
+
+    def shutdown(self):
+        for handle in list(self.handles.values()):
+            self.close(handle)
+        for worker in self.workers:
+            worker["conn"].close()
+            worker["process"].join(timeout=1)
+        self.workers = []
+
+
 # =============================================================================
 # Actual Tornado code starts here:
 
@@ -169,21 +815,97 @@ class PageHandler(tornado.web.RequestHandler):
 
 
 class SocketHandler(tornado.websocket.WebSocketHandler):
-    """ Handler for websocket. """
+    """ Handler for websocket.
+
+    Each connection drives its own session. Connecting to /ws?session=<id>
+    attaches to the named session, which outlives the connection until it is
+    evicted; otherwise the connection gets a private session which is closed
+    with it.
+
+    Stepping and rendering run on the session's executor (see SessionPool),
+    never on the IOLoop; the handlers wait for the results as coroutines.
+    """
     def open(self):
         if self.application.verbose:
             print("Socket opened!")
+        session_id = self.get_argument("session", None)
+        self.anonymous = session_id is None
+        if self.anonymous:
+            session_id = uuid.uuid4().hex
+        self.player = None
+        try:
+            self.session = self.application.open_session(session_id)
+        except SessionLimitError as e:
+            self.session = None
+            self.write_message({"type": "error", "message": str(e)})
+            self.close()
+
+    def on_close(self):
+        self.player = None
+        if self.session is not None:
+            self.application.release_session(self.session, self.anonymous)
+            self.session = None
 
     def check_origin(self, origin):
         return True
 
-    @property
-    def viz_state_message(self):
-        return {
-            "type": "viz_state",
-            "data": self.application.render_model()
-        }
+    def call(self, method, *args):
+        """ Call a Session method; yield the returned Future for its result. """
+        return self.application.sessions.call(self.session, method, *args)
 
+    def send(self, message):
+        """ Send a session result: a JSON message, a binary frame or nothing. """
+        if message is None or self.ws_connection is None:
+            return  # Nothing to send, or the socket closed while the session worked
+        if isinstance(message, bytes):
+            self.write_message(message, binary=True)
+        else:
+            self.write_message(message)
+
+    def play(self, fps=30, steps_per_frame=1, window=2, max_lag=None):
+        """ Start (or retune) play mode; see the protocol description. """
+        self.player = {"interval": 1 / max(fps, 0.1),
+                       "steps": max(int(steps_per_frame), 1),
+                       "window": max(int(window), 1),
+                       "max_lag": max(int(fps * steps_per_frame) if max_lag is None else int(max_lag), 0),
+                       "in_flight": 0}
+        tornado.ioloop.IOLoop.current().spawn_callback(self.play_loop, self.player)
+
+    @tornado.gen.coroutine
+    def play_loop(self, player):
+        lag = 0  # Steps run since the last frame was sent
+        while self.player is player:
+            started = time.time()
+            if player["in_flight"] < player["window"]:
+                message = yield self.call("run", player["steps"])
+                if self.player is not player:
+                    return
+                self.send(message)
+                if isinstance(message, dict) and message["type"] == "end":
+                    self.player = None
+                    return
+                player["in_flight"] += 1
+                lag = 0
+            elif lag < player["max_lag"]:
+                # Out of credit: keep the model going, the client gets the
+                # merged result with its next frame
+                lag += yield self.call("run", min(player["steps"], player["max_lag"] - lag), False)
+            yield tornado.gen.sleep(max(player["interval"] - (time.time() - started), 0))
+
+    @tornado.gen.coroutine
+    def run_steps(self, steps, chunk=100):
+        """ Run steps steps in chunks, so pause and reset can get in between, then send one frame. """
+        self.player = None
+        while steps > 0 and self.session is not None:
+            count = yield self.call("run", min(steps, chunk), False)
+            if count < min(steps, chunk):
+                break
+            steps -= count
+        if self.session is not None:
+            message = yield self.call("run", 0)
+            self.send(message)
+
+    @tornado.gen.coroutine
     def on_message(self, message):
         """ Receiving a message from the websocket, parse, and act accordingly.
 
@@ -192,33 +914,57 @@ class SocketHandler(tornado.websocket.WebSocketHandler):
             print(message)
         msg = tornado.escape.json_decode(message)
 
+        if self.session is None:
+            return
+
         if msg["type"] == "get_step":
-            if not self.application.model.running:
-                self.write_message({"type": "end"})
-            else:
-                self.application.model.step()
-                self.write_message(self.viz_state_message)
+            message = yield self.call("get_step", msg.get("step"))
+            self.send(message)
 
         elif msg["type"] == "reset":
-            self.application.reset_model()
-            self.write_message(self.viz_state_message)
+            message = yield self.call("reset")
+            self.send(message)
+
+        elif msg["type"] == "set_protocol":
+            self.call("set_protocol", msg.get("protocol"))
+
+        elif msg["type"] == "ack":
+            self.call("ack", msg.get("seq"))
+            if self.player is not None:
+                self.player["in_flight"] = max(self.player["in_flight"] - 1, 0)
+
+        elif msg["type"] == "play":
+            self.play(msg.get("fps", 30), msg.get("steps_per_frame", 1),
+                      msg.get("window", 2), msg.get("max_lag"))
+
+        elif msg["type"] == "pause":
+            self.player = None
+            message = yield self.call("position")
+            self.send(message)
+
+        elif msg["type"] == "run_steps":
+            tornado.ioloop.IOLoop.current().spawn_callback(self.run_steps, int(msg["steps"]))
+
+        elif msg["type"] == "resync":
+            message = yield self.call("resync")
+            self.send(message)
 
         elif msg["type"] == "submit_params":
             param = msg["param"]
             value = msg["value"]
 
-            # Is the param editable?
+            # Is the param editable? Changes apply to this session's next reset.
             if param in self.application.user_params:
-                if isinstance(self.application.model_kwargs[param], UserSettableParameter):
-                    self.application.model_kwargs[param].value = value
-                else:
-                    self.application.model_kwargs[param] = value
+                self.call("set_param", param, value)
 
         elif msg["type"] == "get_params":
-            self.write_message({
-                "type": "model_params",
-                "params": self.application.user_params
-            })
+            # The controls of the server's parameters, showing this session's values
+            values = yield self.call("params")
+            params = self.application.user_params
+            for param, value in values.items():
+                if param in params:
+                    params[param] = dict(params[param], value=value)
+            self.send({"type": "model_params", "params": params})
 
         else:
             if self.application.verbose:
@@ -260,7 +1006,8 @@ class ModularServer(tornado.web.Application):
     EXCLUDE_LIST = ('width', 'height',)
 
     def __init__(self, model_cls,visualization_elements, name="Mesa Model",
-                 model_params={}):
+                 model_params={}, workers=0, max_sessions=64, session_timeout=600,
+                 record_dir=None, replay=None):
         """ Create a new visualization server with the given elements. """
         # Prep visualization elements:
         self.visualization_elements = visualization_elements
@@ -280,15 +1027,37 @@ class ModularServer(tornado.web.Application):
         self.description = 'No description available'
         if hasattr(model_cls, 'description'):
             self.description = model_cls.description
-        elif model_cls.__doc__ is not None:
+        elif model_cls is not None and model_cls.__doc__ is not None:
             self.description = model_cls.__doc__
 
         self.model_kwargs = model_params
-        self.reset_model()
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self.session_timeout = session_timeout
+        self.record_dir = record_dir
+        self.replay = replay
+        self.sessions = None
 
         # Initializing the application itself:
         super().__init__(self.handlers, **self.settings)
 
+    def start_sessions(self):
+        """ Create the session pool, starting worker processes if configured. """
+        if self.sessions is None:
+            self.sessions = SessionPool(self.model_cls, self.visualization_elements,
+                                        self.workers, self.max_sessions,
+                                        self.session_timeout, self.record_dir,
+                                        self.replay)
+        return self.sessions
+
+    def open_session(self, session_id):
+        return self.start_sessions().open(session_id, self.model_params())
+
+    def release_session(self, handle, close=False):
+        self.sessions.release(handle)
+        if close:
+            self.sessions.close(handle)
+
     @property
     def user_params(self):
         result = {}
@@ -298,9 +1067,8 @@ class ModularServer(tornado.web.Application):
 
         return result
 
-    def reset_model(self):
-        """ Reinstantiate the model object, using the current parameters. """
-
+    def model_params(self):
+        """ The current values of the model parameters, as keyword arguments. """
         model_params = {}
         for key, val in self.model_kwargs.items():
             if isinstance(val, UserSettableParameter):
@@ -309,32 +1077,29 @@ class ModularServer(tornado.web.Application):
                 model_params[key] = val.value
             else:
                 model_params[key] = val
+        return model_params
 
-        self.model = self.model_cls(**model_params)
-
-    def render_model(self):
-        """ Turn the current state of the model into a dictionary of
-        visualizations
+    def launch(self, port=None, processes=None):
+        """ Run the app.
 
+        Args:
+            port: Port to listen on.
+            processes: Number of worker processes hosting the model sessions;
+                       defaults to the workers given to the constructor, 0
+                       runs the models in the server process.
         """
-        visualization_state = []
-        for element in self.visualization_elements:
-            element_state = element.render(self.model)
-            visualization_state.append(element_state)
-        return visualization_state
-
-    def launch(self, port=None,processes=1):
-        """ Run the app. """
-        startLoop = not tornado.ioloop.IOLoop.initialized()
         if port is not None:
             self.port = port
-        if processes > multiprocessing.cpu_count():
-            processes = multiprocessing.cpu_count()
+        if processes is not None:
+            self.workers = min(processes, multiprocessing.cpu_count())
+        self.start_sessions()
         url = 'http://127.0.0.1:{PORT}'.format(PORT=self.port)
         print('Interface starting at {url}'.format(url=url))
-        server = tornado.httpserver.HTTPServer(self)
-        server.bind(self.port)
-        server.start(processes)
+        self.listen(self.port)
+        tornado.ioloop.PeriodicCallback(self.sessions.evict_idle,
+                                        1000*min(self.session_timeout, 60)).start()
         webbrowser.open(url)
-        if startLoop:
-            tornado.ioloop.IOLoop.instance().start()
+        try:
+            tornado.ioloop.IOLoop.current().start()
+        finally:
+            self.sessions.shutdown()